@@ -0,0 +1,18 @@
+from django.contrib import admin
+
+from .models import ProductSales, RestaurantSales
+
+
+@admin.register(RestaurantSales)
+class RestaurantSalesAdmin(admin.ModelAdmin):
+    list_display = ['day', 'restaurant', 'status', 'orders_count', 'revenue']
+    list_filter = ['status', 'restaurant']
+    list_select_related = ['restaurant']
+    date_hierarchy = 'day'
+
+
+@admin.register(ProductSales)
+class ProductSalesAdmin(admin.ModelAdmin):
+    list_display = ['day', 'product', 'orders_count', 'quantity', 'revenue']
+    list_select_related = ['product']
+    date_hierarchy = 'day'
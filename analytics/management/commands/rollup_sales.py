@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from analytics.rollups import rollup_sales
+
+
+class Command(BaseCommand):
+    help = 'Update sales rollups for days of orders changed since previous run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='rebuild rollups of all days')
+
+    def handle(self, *args, **options):
+        days = rollup_sales(full=options['full'])
+        self.stdout.write(f'Recalculated days: {len(days)}')
@@ -0,0 +1,74 @@
+# Generated by Django 3.2 on 2026-10-18 18:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('foodcartapp', '0058_order_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='название')),
+                ('value', models.DateTimeField(verbose_name='обработаны изменения до')),
+            ],
+            options={
+                'verbose_name': 'отметка обработки',
+                'verbose_name_plural': 'отметки обработки',
+            },
+        ),
+        migrations.CreateModel(
+            name='RestaurantSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('status', models.CharField(choices=[('START', 'принят'), ('WORK', 'в работе'), ('CANCEL', 'отменен'), ('FINISH', 'завершен')], max_length=10, verbose_name='статус')),
+                ('orders_count', models.PositiveIntegerField(verbose_name='заказов')),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='сумма')),
+                ('restaurant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='foodcartapp.restaurant', verbose_name='ресторан')),
+            ],
+            options={
+                'verbose_name': 'продажи ресторана за день',
+                'verbose_name_plural': 'продажи ресторанов по дням',
+            },
+        ),
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='день')),
+                ('orders_count', models.PositiveIntegerField(verbose_name='заказов')),
+                ('quantity', models.PositiveIntegerField(verbose_name='количество')),
+                ('revenue', models.DecimalField(decimal_places=2, max_digits=14, verbose_name='сумма')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales', to='foodcartapp.product', verbose_name='товар')),
+            ],
+            options={
+                'verbose_name': 'продажи товара за день',
+                'verbose_name_plural': 'продажи товаров по дням',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='restaurantsales',
+            index=models.Index(fields=['day'], name='analytics_r_day_58132e_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='restaurantsales',
+            unique_together={('restaurant', 'day', 'status')},
+        ),
+        migrations.AddIndex(
+            model_name='productsales',
+            index=models.Index(fields=['day'], name='analytics_p_day_b4c77a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='productsales',
+            unique_together={('product', 'day')},
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import models
+
+from foodcartapp.models import Order, Product, Restaurant
+
+
+class RestaurantSales(models.Model):
+    """Orders per restaurant, day of registration and status, see analytics.rollups"""
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='sales',
+                                   verbose_name='ресторан', null=True, blank=True)
+    day = models.DateField('день')
+    status = models.CharField('статус', max_length=10, choices=Order.STATUSES)
+    orders_count = models.PositiveIntegerField('заказов')
+    revenue = models.DecimalField('сумма', max_digits=14, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'продажи ресторана за день'
+        verbose_name_plural = 'продажи ресторанов по дням'
+        unique_together = [
+            ['restaurant', 'day', 'status']
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+
+class ProductSales(models.Model):
+    """Sold products per day of order registration, cancelled orders are not counted"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='sales', verbose_name='товар')
+    day = models.DateField('день')
+    orders_count = models.PositiveIntegerField('заказов')
+    quantity = models.PositiveIntegerField('количество')
+    revenue = models.DecimalField('сумма', max_digits=14, decimal_places=2)
+
+    class Meta:
+        verbose_name = 'продажи товара за день'
+        verbose_name_plural = 'продажи товаров по дням'
+        unique_together = [
+            ['product', 'day']
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+
+
+class RollupWatermark(models.Model):
+    name = models.CharField('название', max_length=50, unique=True)
+    value = models.DateTimeField('обработаны изменения до')
+
+    class Meta:
+        verbose_name = 'отметка обработки'
+        verbose_name_plural = 'отметки обработки'
+
+    def __str__(self):
+        return f'{self.name}: {self.value}'
@@ -0,0 +1,96 @@
+import datetime
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from foodcartapp.models import Order, OrderedProduct
+from .models import ProductSales, RestaurantSales, RollupWatermark
+
+WATERMARK_NAME = 'sales'
+DAYS_IN_BATCH = 31
+
+
+def registrated_on(days, field='registrated'):
+    """Condition on registration time within given local days, ranges can use index unlike __date"""
+    condition = Q()
+    for day in days:
+        start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+        end = timezone.make_aware(datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min))
+        condition |= Q(**{f'{field}__gte': start, f'{field}__lt': end})
+    return condition
+
+
+def rebuild_days(days):
+    """Replace rollup rows of given days with fresh aggregates of their orders"""
+    restaurant_sales = Order.objects \
+        .filter(registrated_on(days)) \
+        .annotate(day=TruncDate('registrated')) \
+        .values('restaurant', 'day', 'status') \
+        .annotate(orders_count=Count('id'), revenue=Sum('total')) \
+        .order_by()
+    product_sales = OrderedProduct.objects \
+        .filter(registrated_on(days, field='order__registrated')) \
+        .exclude(order__status='CANCEL') \
+        .annotate(day=TruncDate('order__registrated')) \
+        .values('product', 'day') \
+        .annotate(revenue=Sum(ExpressionWrapper(F('cost') * F('quantity'), output_field=DecimalField()))) \
+        .annotate(orders_count=Count('order', distinct=True), quantity=Sum('quantity')) \
+        .order_by()
+
+    with transaction.atomic():
+        RestaurantSales.objects.filter(day__in=days).delete()
+        ProductSales.objects.filter(day__in=days).delete()
+        RestaurantSales.objects.bulk_create(
+            RestaurantSales(
+                restaurant_id=row['restaurant'],
+                day=row['day'],
+                status=row['status'],
+                orders_count=row['orders_count'],
+                revenue=row['revenue'] or 0,
+            )
+            for row in restaurant_sales
+        )
+        ProductSales.objects.bulk_create(
+            ProductSales(
+                product_id=row['product'],
+                day=row['day'],
+                orders_count=row['orders_count'],
+                quantity=row['quantity'],
+                revenue=row['revenue'] or 0,
+            )
+            for row in product_sales
+        )
+
+
+def rollup_sales(full=False):
+    """
+    Recalculate rollups for days (by `registrated`) of orders changed since last run.
+    Changes are found by Order.updated, a bit earlier than watermark to catch
+    long transactions (ORDERS_CHANGES_OVERLAP). Deleted orders are not noticed,
+    use full=True to rebuild everything.
+    return: sorted list of recalculated days
+    """
+    started = timezone.now()
+    watermark = RollupWatermark.objects.filter(name=WATERMARK_NAME).first()
+    orders = Order.objects.all()
+    if full or watermark is None:
+        RestaurantSales.objects.all().delete()
+        ProductSales.objects.all().delete()
+    else:
+        since = watermark.value - datetime.timedelta(seconds=settings.ORDERS_CHANGES_OVERLAP)
+        orders = orders.filter(updated__gte=since)
+    days = sorted(
+        orders
+            .annotate(day=TruncDate('registrated'))
+            .values_list('day', flat=True)
+            .order_by()
+            .distinct()
+    )
+
+    for start in range(0, len(days), DAYS_IN_BATCH):
+        rebuild_days(days[start:start + DAYS_IN_BATCH])
+    RollupWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': started})
+    return days
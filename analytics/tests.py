@@ -0,0 +1,74 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from foodcartapp.models import Order, OrderedProduct, Product, Restaurant
+from .models import ProductSales, RestaurantSales
+from .rollups import rollup_sales
+
+
+class RollupSalesTest(TestCase):
+    def setUp(self):
+        self.restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская, 10')
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        now = timezone.now()
+        self.days = [timezone.localdate(now - timedelta(days=3)), timezone.localdate(now - timedelta(days=1))]
+        self.orders = []
+        for registrated, status, quantity in [
+            (now - timedelta(days=3), 'FINISH', 1),
+            (now - timedelta(days=3), 'CANCEL', 5),
+            (now - timedelta(days=1), 'FINISH', 2),
+        ]:
+            order = Order.objects.create(
+                firstname='Иван', lastname='Петров', phonenumber='+79161234567', address='Москва',
+                registrated=registrated, status=status, restaurant=self.restaurant,
+            )
+            OrderedProduct.objects.create(order=order, product=self.burger, quantity=quantity, cost=100)
+            self.orders.append(order)
+        # changed long before the first rollup
+        Order.objects.update(updated=now - timedelta(hours=1))
+
+    def restaurant_sales(self):
+        return set(RestaurantSales.objects.values_list('day', 'status', 'orders_count', 'revenue'))
+
+    def product_sales(self):
+        return set(ProductSales.objects.values_list('day', 'orders_count', 'quantity', 'revenue'))
+
+    def test_first_run_builds_all_days(self):
+        self.assertEqual(rollup_sales(), self.days)
+        self.assertEqual(self.restaurant_sales(), {
+            (self.days[0], 'FINISH', 1, Decimal(100)),
+            (self.days[0], 'CANCEL', 1, Decimal(500)),
+            (self.days[1], 'FINISH', 1, Decimal(200)),
+        })
+        self.assertEqual(self.product_sales(), {
+            (self.days[0], 1, 1, Decimal(100)),
+            (self.days[1], 1, 2, Decimal(200)),
+        })
+
+    def test_only_days_of_changed_orders_are_recounted(self):
+        rollup_sales()
+        self.assertEqual(rollup_sales(), [])
+
+        cancelled = self.orders[1]
+        cancelled.status = 'FINISH'
+        # instance was loaded before its products were added, its total is stale
+        cancelled.save(update_fields=['status', 'updated'])
+        self.assertEqual(rollup_sales(), [self.days[0]])
+        self.assertEqual(self.restaurant_sales(), {
+            (self.days[0], 'FINISH', 2, Decimal(600)),
+            (self.days[1], 'FINISH', 1, Decimal(200)),
+        })
+        self.assertIn((self.days[0], 2, 6, Decimal(600)), self.product_sales())
+
+    def test_full_rebuild(self):
+        rollup_sales()
+        RestaurantSales.objects.update(orders_count=0)
+        self.orders[2].delete()
+        self.assertEqual(rollup_sales(full=True), [self.days[0]])
+        self.assertEqual(self.restaurant_sales(), {
+            (self.days[0], 'FINISH', 1, Decimal(100)),
+            (self.days[0], 'CANCEL', 1, Decimal(500)),
+        })
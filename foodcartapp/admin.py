@@ -1,17 +1,25 @@
+import re
+
 from django.conf import settings
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
 from django.shortcuts import reverse, redirect
 from django.templatetags.static import static
 from django.utils.html import format_html
 from django.utils.http import is_safe_url,url_has_allowed_host_and_scheme
-from django.db.models import Count
+from django.db import connections, transaction
+from django.db.models import Case, Count, Q, When
+from django.utils.functional import cached_property
 
+from .assignment import assign_orders
+from .candidates import refresh_candidates
 from .models import OrderedProduct
 from .models import Order
 from .models import Product
 from .models import ProductCategory
 from .models import Restaurant
 from .models import RestaurantMenuItem
+from .spatial import locate_restaurants
 
 
 class RestaurantMenuItemInline(admin.TabularInline):
@@ -32,11 +40,26 @@ class RestaurantAdmin(admin.ModelAdmin):
         'name',
         'address',
         'contact_phone',
+        'capacity',
+    ]
+    readonly_fields = [
+        'lat',
+        'lon',
     ]
     inlines = [
         RestaurantMenuItemInline
     ]
 
+    def save_model(self, request, obj, form, change):
+        if 'address' in form.changed_data or obj.lat is None or obj.lon is None:
+            if locate_restaurants([obj]) and obj.address:
+                self.message_user(
+                    request,
+                    f'Координаты адреса «{obj.address}» не определены, ресторан получит их после геокодирования',
+                    messages.WARNING,
+                )
+        super().save_model(request, obj, form, change)
+
 
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
@@ -121,13 +144,89 @@ class OrderedProductInline(admin.TabularInline):
     fields = ('order','product','quantity','cost')
     readonly_fields = ('cost',)
 
+class EstimatedCountPaginator(Paginator):
+    '''
+    Exact COUNT(*) of a big table is a sequential scan in PostgreSQL, so unfiltered
+    lists show row estimate from planner statistics when table is big enough
+    '''
+
+    @cached_property
+    def count(self):
+        query = self.object_list.query
+        connection = connections[self.object_list.db]
+        if connection.vendor == 'postgresql' and not query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                    [self.object_list.model._meta.db_table],
+                )
+                estimate = cursor.fetchone()[0]
+            if estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
+
+
+def phonenumber_prefix(search_term):
+    '''Convert typed phone like "8 (916) 12" or "916 12" to prefix of stored E.164 number "+791612"'''
+    digits = re.sub(r'\D', '', search_term)
+    if not digits:
+        return None
+    if search_term.lstrip().startswith('+'):
+        return '+' + digits
+    if digits[0] == '8':
+        digits = digits[1:]
+    elif digits[0] == '7':
+        # russian codes don't start with 7, so it is the country code typed without plus
+        digits = digits[1:]
+    return '+7' + digits
+
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    search_fields = ['id', 'firstname', 'lastname', 'phonenumber', 'address']
+    search_fields = ['id', 'firstname', 'lastname', 'phonenumber']
     ordering = ['id']
+    list_display = ['id', 'status', 'firstname', 'lastname', 'phonenumber', 'address', 'restaurant', 'total']
     list_filter = ('status', 'restaurant')
+    list_select_related = ['restaurant']
+    readonly_fields = ['total']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
     inlines = [OrderedProductInline]
-    pass
+    actions = ['assign_restaurants']
+
+    @admin.action(description='Назначить рестораны выбранным заказам')
+    def assign_restaurants(self, request, queryset):
+        '''Nearest restaurants for accepted orders within restaurants capacity, see foodcartapp.assignment'''
+        assigned_count, left_count = assign_orders(queryset)
+        self.message_user(request, f'Назначено заказов: {assigned_count}', messages.SUCCESS)
+        if left_count:
+            self.message_user(
+                request,
+                f'Без ресторана осталось заказов: {left_count} - нет свободных ресторанов поблизости '
+                f'или координаты не определены',
+                messages.WARNING,
+            )
+
+    def get_search_results(self, request, queryset, search_term):
+        '''
+        Only lookups which can use indexes: exact id, phone prefix and case insensitive
+        prefixes of first and last names. Address is not searched, it needs a trigram index.
+        '''
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if re.fullmatch(r'[\d\s()+-]+', search_term):
+            prefix = phonenumber_prefix(search_term)
+            if prefix is None:
+                return queryset.none(), False
+            condition = Q(phonenumber__startswith=prefix)
+            if search_term.isdigit():
+                condition |= Q(id=int(search_term))
+            return queryset.filter(condition), False
+        # every word is a prefix of first or last name, so "Иван Пет" finds Иван Петров
+        for word in search_term.split():
+            queryset = queryset.filter(Q(firstname__istartswith=word) | Q(lastname__istartswith=word))
+        return queryset, False
 
     def save_formset(self, request, form, formset, change):
         for inline_form in formset.forms:
@@ -135,10 +234,23 @@ class OrderAdmin(admin.ModelAdmin):
                 inline_form.instance.cost=inline_form.instance.product.price
         super().save_formset(request, form, formset, change)
 
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if 'address' in form.changed_data or any(formset.has_changed() for formset in formsets):
+            order_id = form.instance.id
+            transaction.on_commit(lambda: refresh_candidates([order_id]))
+
     def save_model(self, request, obj, form, change):
         if obj.status=='START' and obj.restaurant:
             obj.status='WORK'
-        super().save_model(request, obj, form, change)
+        if not change:
+            super().save_model(request, obj, form, change)
+            return
+        # total may be shifted by UPDATEs of foodcartapp.totals since obj was read, keep it as stored
+        obj.save(update_fields=[
+            field.name for field in obj._meta.concrete_fields
+            if not field.primary_key and field.name != 'total'
+        ])
 
     def response_post_save_change(self, request, obj):
         if "next" in request.GET and url_has_allowed_host_and_scheme(request.GET['next'], settings.ALLOWED_HOSTS):
@@ -146,11 +258,18 @@ class OrderAdmin(admin.ModelAdmin):
         return super().response_post_save_change(request, obj)
 
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-        '''limit the choice of restaurants to those who can cook'''
+        '''limit the choice of restaurants to those who can cook and the current one, nearest first'''
         if db_field.name == "restaurant":
             path = str(request.path).split('/')
             if path[-2] == 'change':
                 order_id = int(path[-3])
-                restaurants = Order.objects.filter(pk=order_id).calc_can_cook()[order_id]
-                kwargs["queryset"] = Restaurant.objects.filter(id__in=restaurants)
+                order = Order.objects.filter(pk=order_id)
+                can_cook = order.can_cook_with_distance(restaurant_by_name=False)
+                restaurants = [restaurant.name for restaurant in can_cook.get(order_id, [])]
+                current_restaurant = order.values_list('restaurant_id', flat=True).first()
+                if current_restaurant is not None and current_restaurant not in restaurants:
+                    restaurants.append(current_restaurant)
+                kwargs["queryset"] = Restaurant.objects \
+                    .filter(id__in=restaurants) \
+                    .order_by(Case(*[When(id=restaurant, then=rank) for rank, restaurant in enumerate(restaurants)]))
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
@@ -0,0 +1,112 @@
+from collections import defaultdict, namedtuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from scipy.optimize import linear_sum_assignment
+
+from .models import Order, Restaurant
+from .versions import bump_version
+
+Assignment = namedtuple('Assignment', 'order restaurant distance')
+
+
+def pending_orders(orders):
+    return orders.filter(status='START', restaurant__isnull=True)
+
+
+def plan_assignment(orders):
+    """
+    Assign pending orders to restaurants which can cook them with the least total
+    distance. Every capable restaurant is considered, not only nearest OrderCandidate
+    ones, so an order gets a farther restaurant when the nearest are full.
+    A restaurant takes no more orders than its free capacity: Restaurant.capacity
+    minus its orders in work. Capacity is modelled by repeating restaurant column
+    once per free slot, then the rectangular problem is solved by scipy
+    linear_sum_assignment. Pairs with unknown distance are skipped.
+    return: list like this: [Assignment(order_id, restaurant_id, distance), ...]
+        orders which got no restaurant are omitted
+    """
+    can_cook = pending_orders(orders).can_cook_with_distance(restaurant_by_name=False)
+    candidates = np.array(
+        [
+            (order, restaurant.name, restaurant.distance)
+            for order, restaurants in can_cook.items()
+            for restaurant in restaurants
+            if restaurant.distance is not None
+        ],
+        dtype=float,
+    ).reshape(-1, 3)
+    if not len(candidates):
+        return []
+    order_ids, order_rows = np.unique(candidates[:, 0].astype(int), return_inverse=True)
+    restaurant_ids, restaurant_columns = np.unique(candidates[:, 1].astype(int), return_inverse=True)
+    distances = candidates[:, 2]
+
+    capacities = dict(Restaurant.objects.filter(id__in=restaurant_ids.tolist()).values_list('id', 'capacity'))
+    busy = dict(
+        Order.objects
+        .filter(status='WORK', restaurant_id__in=restaurant_ids.tolist())
+        .values('restaurant_id')
+        .annotate(orders_count=Count('id'))
+        .values_list('restaurant_id', 'orders_count')
+    )
+    free_slots = np.array(
+        [max(capacities.get(restaurant, 0) - busy.get(restaurant, 0), 0) for restaurant in restaurant_ids.tolist()],
+        dtype=int,
+    )
+    # no restaurant needs more slots than orders able to go there
+    slots = np.minimum(free_slots, np.bincount(restaurant_columns, minlength=len(restaurant_ids)))
+    if not slots.sum():
+        return []
+    first_slots = np.cumsum(slots) - slots
+    slot_restaurants = np.repeat(np.arange(len(restaurant_ids)), slots)
+
+    # every candidate is copied to all slots of its restaurant
+    copies = slots[restaurant_columns]
+    copy_numbers = np.arange(copies.sum()) - np.repeat(np.cumsum(copies) - copies, copies)
+    # cost of a missing pair exceeds any sum of real distances, so the solver assigns as many orders as possible
+    missing_cost = distances.sum() + 1
+    cost = np.full((len(order_ids), slots.sum()), missing_cost)
+    cost[np.repeat(order_rows, copies), np.repeat(first_slots[restaurant_columns], copies) + copy_numbers] = \
+        np.repeat(distances, copies)
+
+    rows, columns = linear_sum_assignment(cost)
+    return [
+        Assignment(int(order_ids[row]), int(restaurant_ids[slot_restaurants[column]]), float(cost[row, column]))
+        for row, column in zip(rows, columns)
+        if cost[row, column] < missing_cost
+    ]
+
+
+def apply_assignment(assignments):
+    """
+    Set restaurants of orders and put them in work, orders which are not pending anymore are skipped
+    return: count of assigned orders
+    """
+    orders_by_restaurant = defaultdict(list)
+    for assignment in assignments:
+        orders_by_restaurant[assignment.restaurant].append(assignment.order)
+    now = timezone.now()
+    assigned_count = 0
+    with transaction.atomic():
+        for restaurant, order_ids in orders_by_restaurant.items():
+            assigned_count += pending_orders(Order.objects.filter(id__in=order_ids)) \
+                .update(restaurant_id=restaurant, status='WORK', updated=now)
+        if assigned_count:
+            transaction.on_commit(lambda: bump_version('orders'))
+    return assigned_count
+
+
+def assign_orders(orders):
+    """
+    Plan and apply assignment of pending orders. Restaurants are locked meanwhile,
+    so concurrent runs don't exceed their capacity together.
+    return: tuple (count of assigned orders, count of orders left without restaurant)
+    """
+    with transaction.atomic():
+        list(Restaurant.objects.select_for_update().order_by('id').values_list('id', flat=True))
+        assignments = plan_assignment(orders)
+        assigned_count = apply_assignment(assignments)
+        return assigned_count, pending_orders(orders).count()
@@ -0,0 +1,120 @@
+import threading
+from collections import defaultdict
+
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from .batches import TransactionBatch
+from .models import RestaurantMenuItem
+from .versions import bump_version, get_version
+
+VERSION_NAME = 'availability'
+
+
+def restaurants_from_mask(mask):
+    """Decode restaurant bitset to list of restaurant ids"""
+    restaurants = []
+    while mask:
+        lowest_bit = mask & -mask
+        restaurants.append(lowest_bit.bit_length() - 1)
+        mask ^= lowest_bit
+    return restaurants
+
+
+class AvailabilityIndex:
+    """
+    Per-process index of available products: {product_id: restaurants bitset}
+    where bit number N is set if restaurant with id=N has the product in stock.
+    Index is built once, then patched by RestaurantMenuItem signals. Shared
+    version counter (in Django cache) tells other processes to rebuild it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._masks = None
+        self._version = None
+
+    @staticmethod
+    def _load():
+        masks = defaultdict(int)
+        menu_items = RestaurantMenuItem.objects \
+            .filter(availability=True) \
+            .values_list('product_id', 'restaurant_id')
+        for product, restaurant in menu_items:
+            masks[product] |= 1 << restaurant
+        return dict(masks)
+
+    def get_masks(self):
+        version = get_version(VERSION_NAME)
+        with self._lock:
+            if self._masks is None or self._version != version:
+                self._masks = self._load()
+                self._version = version
+            return self._masks
+
+    def can_cook(self, products):
+        """Return bitset of restaurants which have all of the products"""
+        masks = self.get_masks()
+        products = list(products)
+        if not products:
+            return 0
+        mask = masks.get(products[0], 0)
+        for product in products[1:]:
+            mask &= masks.get(product, 0)
+        return mask
+
+    def update(self, changes):
+        """
+        Patch index with changes like [(product_id, restaurant_id, available), ...]
+        If another process has changed the menu meanwhile, index is just
+        dropped and will be rebuilt on next access.
+        """
+        version = bump_version(VERSION_NAME)
+        with self._lock:
+            if self._masks is None or self._version != version - 1:
+                self._masks = None
+                return
+            masks = dict(self._masks)
+            for product, restaurant, available in changes:
+                if available:
+                    masks[product] = masks.get(product, 0) | (1 << restaurant)
+                else:
+                    masks[product] = masks.get(product, 0) & ~(1 << restaurant)
+            self._masks = masks
+            self._version = version
+
+    def clear(self):
+        with self._lock:
+            self._masks = None
+
+
+availability_index = AvailabilityIndex()
+
+
+class IndexUpdate(TransactionBatch):
+    """Menu changes of a transaction are applied to the index at once, after it commits"""
+
+    def handle(self, changes):
+        availability_index.update(changes)
+
+
+@receiver(post_init, sender=RestaurantMenuItem)
+def remember_menu_item_state(sender, instance, **kwargs):
+    instance._indexed_state = (instance.product_id, instance.restaurant_id, instance.availability)
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+def update_index_on_save(sender, instance, created, **kwargs):
+    old_product, old_restaurant, _ = instance._indexed_state
+    changes = []
+    if not created and (old_product, old_restaurant) != (instance.product_id, instance.restaurant_id):
+        changes.append((old_product, old_restaurant, False))
+    changes.append((instance.product_id, instance.restaurant_id, instance.availability))
+    instance._indexed_state = (instance.product_id, instance.restaurant_id, instance.availability)
+    IndexUpdate.add(changes)
+
+
+@receiver(post_delete, sender=RestaurantMenuItem)
+def update_index_on_delete(sender, instance, **kwargs):
+    changes = [(instance.product_id, instance.restaurant_id, False)]
+    IndexUpdate.add(changes)
@@ -0,0 +1,42 @@
+import threading
+import weakref
+
+from django.db import transaction
+
+_pending = threading.local()
+
+
+class TransactionBatch:
+    """
+    Items collected during a transaction and handled at once after it commits.
+    Subclasses implement handle(items), add() is called instead of transaction.on_commit.
+    Batch is registered with on_commit by the first add() of a transaction, only a weak
+    reference is kept besides: batch of rolled back transaction is dropped by Django and
+    garbage collected, so the next add() starts a new batch.
+    """
+
+    def __init__(self):
+        self.items = []
+
+    @classmethod
+    def add(cls, items):
+        batches = _pending.__dict__.setdefault('batches', {})
+        reference = batches.get(cls)
+        batch = reference() if reference is not None else None
+        if batch is not None:
+            batch.items.extend(items)
+            return
+        batch = cls()
+        batch.items.extend(items)
+        batches[cls] = weakref.ref(batch)
+        transaction.on_commit(batch)
+
+    def __call__(self):
+        batches = _pending.__dict__.setdefault('batches', {})
+        reference = batches.get(type(self))
+        if reference is not None and reference() is self:
+            del batches[type(self)]
+        self.handle(self.items)
+
+    def handle(self, items):
+        raise NotImplementedError
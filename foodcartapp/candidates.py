@@ -0,0 +1,130 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from geocoder.models import Location, locations_added
+from geocoder.normalization import normalize_address
+from .batches import TransactionBatch
+from .models import Order, OrderCandidate, OrderedProduct, Restaurant, RestaurantMenuItem
+from .spatial import locate_geocoded_restaurants
+from .versions import bump_version
+
+REFRESH_CHUNK_SIZE = 500
+
+
+def refresh_candidates(order_ids):
+    """
+    Recalculate OrderCandidate rows of orders - MANAGER_CANDIDATES_LIMIT nearest
+    restaurants which can cook them, see OrderQuerySet.can_cook_with_distance
+    """
+    order_ids = list(order_ids)
+    for start in range(0, len(order_ids), REFRESH_CHUNK_SIZE):
+        chunk = order_ids[start:start + REFRESH_CHUNK_SIZE]
+        can_cook = Order.objects.filter(id__in=chunk).can_cook_with_distance(
+            restaurant_by_name=False,
+            limit=settings.MANAGER_CANDIDATES_LIMIT,
+        )
+        candidates = [
+            OrderCandidate(order_id=order, restaurant_id=restaurant.name, distance=restaurant.distance, rank=rank)
+            for order, restaurants in can_cook.items()
+            for rank, restaurant in enumerate(restaurants)
+        ]
+        with transaction.atomic():
+            OrderCandidate.objects.filter(order_id__in=chunk).delete()
+            OrderCandidate.objects.bulk_create(candidates)
+            Order.objects.filter(id__in=chunk).update(updated=timezone.now())
+            transaction.on_commit(lambda: bump_version('orders'))
+
+
+def refresh_candidates_on_commit(orders_query):
+    """Refresh candidates of new orders matching the query after current transaction commits"""
+    def refresh():
+        refresh_candidates(orders_query.filter(status='START').values_list('id', flat=True).distinct())
+    transaction.on_commit(refresh)
+
+
+class ProductsRefresh(TransactionBatch):
+    """
+    Candidates of new orders with products changed in a transaction are refreshed once after
+    it commits, so saving restaurant with many menu items recalculates each order only once.
+    It is registered after availability.IndexUpdate of the same transaction, so runs after it.
+    """
+
+    def handle(self, product_ids):
+        refresh_candidates(
+            Order.objects
+            .filter(status='START', products__product_id__in=set(product_ids))
+            .values_list('id', flat=True)
+            .distinct()
+        )
+
+
+def refresh_restaurants_on_commit(restaurant_ids):
+    """Refresh candidates of new orders which any of restaurants can cook after current transaction commits"""
+    restaurant_ids = set(restaurant_ids)
+    restaurants_mask = sum(1 << restaurant_id for restaurant_id in restaurant_ids)
+
+    def refresh():
+        # only orders with some product on menu of the restaurants may be cooked there
+        orders = Order.objects.filter(status='START', id__in=OrderedProduct.objects.filter(
+            product__menu_items__restaurant_id__in=restaurant_ids,
+            product__menu_items__availability=True,
+        ).values('order_id'))
+        can_cook = orders.calc_can_cook_masks()
+        refresh_candidates(order for order, order_mask in can_cook.items() if order_mask & restaurants_mask)
+    if restaurants_mask:
+        transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def refresh_on_menu_change(sender, instance, **kwargs):
+    ProductsRefresh.add([instance.product_id])
+
+
+@receiver(post_init, sender=Restaurant)
+def remember_restaurant_coordinates(sender, instance, **kwargs):
+    instance._candidates_coordinates = (instance.lat, instance.lon)
+
+
+@receiver(post_save, sender=Restaurant)
+def refresh_on_restaurant_move(sender, instance, created, **kwargs):
+    """Moved restaurant may get in or out of nearest restaurants of any order it can cook"""
+    coordinates = (instance.lat, instance.lon)
+    if created or coordinates == instance._candidates_coordinates:
+        return
+    instance._candidates_coordinates = coordinates
+    refresh_restaurants_on_commit([instance.id])
+
+
+@receiver(pre_delete, sender=Restaurant)
+def refresh_on_restaurant_delete(sender, instance, **kwargs):
+    """Orders lose deleted restaurant from their candidates, next nearest restaurant takes its place"""
+    refresh_candidates_on_commit(Order.objects.filter(id__in=list(
+        OrderCandidate.objects.filter(restaurant=instance).values_list('order_id', flat=True)
+    )))
+
+
+@receiver(locations_added, sender=Location)
+def refresh_on_geocoding(sender, addresses, **kwargs):
+    """
+    Restaurants at geocoded addresses get coordinates first, then candidates of orders
+    they can cook and of orders at these addresses are refreshed. Addresses are matched by
+    normalized address, see geocoder.normalization
+    """
+    located_restaurants = locate_geocoded_restaurants(addresses)
+    refresh_restaurants_on_commit(restaurant.id for restaurant in located_restaurants)
+    order_ids = list(
+        Order.objects
+        .filter(status='START', normalized_address__in={normalize_address(address) for address in addresses})
+        .values_list('id', flat=True)
+    )
+    if order_ids:
+        transaction.on_commit(lambda: refresh_candidates(order_ids))
+
+
+@receiver(post_save, sender=Order)
+def track_order_change(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version('orders'))
@@ -0,0 +1,44 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product, ProductCategory, RestaurantMenuItem
+from .versions import bump_version, get_version
+
+VERSION_NAME = 'catalog'
+CACHE_KEY_PREFIX = 'foodcartapp:catalog'
+
+
+def catalog_etag(request, *args, **kwargs):
+    """ETag depends on catalog version and query parameters of request"""
+    etag = f'catalog-{get_version(VERSION_NAME)}'
+    if request.GET:
+        etag += '-' + hashlib.md5(request.GET.urlencode().encode()).hexdigest()
+    return f'"{etag}"'
+
+
+def get_cached_catalog(name, build_content):
+    """
+    Return serialized catalog content from cache, call build_content() to
+    make it if catalog version has changed since content was cached
+    """
+    key = f'{CACHE_KEY_PREFIX}:{name}:{get_version(VERSION_NAME)}'
+    content = cache.get(key)
+    if content is None:
+        content = build_content()
+        cache.set(key, content, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return content
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(VERSION_NAME))
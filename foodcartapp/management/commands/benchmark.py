@@ -0,0 +1,222 @@
+import json
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from foodcartapp.assignment import plan_assignment
+from foodcartapp.candidates import refresh_candidates
+from foodcartapp.models import Order, OrderedProduct, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from geocoder.backends import FakeGeocoder
+from geocoder.cache import locations_lru
+from geocoder.models import Location
+from geocoder.normalization import normalize_address
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = 'Measure hot paths on synthetic data in a scratch database, results are printed as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=20)
+        parser.add_argument('--products', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--menu-density', type=float, default=0.7,
+                            help='share of products in menu of every restaurant')
+        parser.add_argument('--geocoded', type=float, default=0.9,
+                            help='share of order addresses with known location')
+        parser.add_argument('--repeat', type=int, default=20, help='measured runs of every scenario')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='write JSON to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat should be positive')
+        self.random = random.Random(options['seed'])
+        old_database_name = connection.settings_dict['NAME']
+        scratch_cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'benchmark',
+        }}
+        fake_backend = 'geocoder.backends.FakeGeocoder'
+        with override_settings(CACHES=scratch_cache, ALLOWED_HOSTS=['testserver'], GEOCODER_BACKEND=fake_backend):
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            locations_lru.clear()
+            try:
+                dataset = self.seed(options)
+                results = self.run_scenarios(options['repeat'])
+            finally:
+                connection.creation.destroy_test_db(old_database_name, verbosity=0)
+                locations_lru.clear()
+
+        report = json.dumps({
+            'started': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'dataset': dataset,
+            'repeat': options['repeat'],
+            'results': results,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
+
+    def seed(self, options):
+        ProductCategory.objects.bulk_create(ProductCategory(name=f'Категория {number}') for number in range(5))
+        categories = list(ProductCategory.objects.all())
+        Product.objects.bulk_create(
+            Product(
+                name=f'Товар {number}',
+                category=self.random.choice(categories),
+                price=Decimal(self.random.randint(50, 500)),
+                image='benchmark.jpg',
+                special_status=self.random.random() < 0.1,
+            )
+            for number in range(options['products'])
+        )
+        geocoder = FakeGeocoder()
+        restaurants = []
+        for number in range(options['restaurants']):
+            address = f'Москва, ресторанная улица, {number}'
+            lon, lat = geocoder.geocode(address)
+            restaurants.append(Restaurant(name=f'Ресторан {number}', address=address, lat=lat, lon=lon))
+        Restaurant.objects.bulk_create(restaurants)
+        products = list(Product.objects.all())
+        restaurants = list(Restaurant.objects.all())
+        RestaurantMenuItem.objects.bulk_create(
+            RestaurantMenuItem(restaurant=restaurant, product=product, availability=self.random.random() < 0.9)
+            for restaurant in restaurants
+            for product in products
+            if self.random.random() < options['menu_density']
+        )
+
+        orders = []
+        for number in range(options['orders']):
+            address = f'Москва, улица заказов, {number}'
+            orders.append(Order(
+                firstname='Иван',
+                lastname=f'Петров{number}',
+                phonenumber=f'+7916{number:07d}',
+                address=address,
+                normalized_address=normalize_address(address),
+                status=self.random.choice(['START', 'START', 'WORK', 'FINISH', 'CANCEL']),
+            ))
+        if connection.features.can_return_rows_from_bulk_insert:
+            Order.objects.bulk_create(orders)
+        else:
+            for order in orders:
+                order.save()
+        ordered_products = []
+        for order in orders:
+            for product in self.random.sample(products, self.random.randint(1, min(4, len(products)))):
+                ordered_products.append(OrderedProduct(
+                    order=order, product=product, quantity=self.random.randint(1, 3), cost=product.price,
+                ))
+        OrderedProduct.objects.bulk_create(ordered_products)
+        Order.objects.recalculate_totals()
+
+        addresses = [restaurant.address for restaurant in restaurants] + [
+            order.address for order in orders if self.random.random() < options['geocoded']
+        ]
+        locations = []
+        for address in addresses:
+            lon, lat = geocoder.geocode(address)
+            locations.append(Location(
+                address=address, normalized_address=normalize_address(address), lon=lon, lat=lat,
+            ))
+        Location.objects.bulk_create(locations)
+
+        refresh_candidates(list(Order.objects.filter(status='START').values_list('id', flat=True)))
+        self.manager = User.objects.create_user('benchmark', is_staff=True)
+        self.available_products = list(Product.objects.available())
+        return {
+            'restaurants': len(restaurants),
+            'products': len(products),
+            'menu_items': RestaurantMenuItem.objects.count(),
+            'orders': len(orders),
+            'ordered_products': len(ordered_products),
+            'locations': len(locations),
+        }
+
+    def get_scenarios(self):
+        client = Client()
+        manager_client = Client()
+        manager_client.force_login(self.manager)
+
+        def get(client, url):
+            def request():
+                response = client.get(url)
+                if response.status_code != 200:
+                    raise CommandError(f'{url} responded with {response.status_code}')
+            return request
+
+        def register_order():
+            order = {
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79161234567',
+                'address': f'Москва, новая улица, {self.random.randint(1, 1000)}',
+                'products': [
+                    {'product': product.id, 'quantity': self.random.randint(1, 3)}
+                    for product in self.random.sample(self.available_products, min(3, len(self.available_products)))
+                ],
+            }
+            response = client.post('/api/order/', order, content_type='application/json')
+            if response.status_code != 200:
+                raise CommandError(f'Order registration responded with {response.status_code}')
+
+        started_orders = Order.objects.filter(status='START')
+        return {
+            'calc_can_cook': lambda: started_orders.calc_can_cook(),
+            'can_cook_with_distance': lambda: started_orders.can_cook_with_distance(),
+            'can_cook_with_distance_nearest': lambda: started_orders.can_cook_with_distance(
+                limit=settings.MANAGER_CANDIDATES_LIMIT,
+            ),
+            'plan_assignment': lambda: plan_assignment(started_orders),
+            'product_list_api': get(client, '/api/products/'),
+            'register_order': register_order,
+            'view_orders': get(manager_client, '/manager/orders/'),
+            'view_products': get(manager_client, '/manager/products/'),
+        }
+
+    def run_scenarios(self, repeat):
+        """First run of every scenario warms up caches and indexes, it is reported separately"""
+        results = {}
+        for name, scenario in self.get_scenarios().items():
+            timings = []
+            queries = []
+            for _ in range(repeat + 1):
+                with CaptureQueriesContext(connection) as context:
+                    started = time.perf_counter()
+                    scenario()
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(context.captured_queries))
+            cold_ms, timings = timings[0], timings[1:]
+            cold_queries, queries = queries[0], queries[1:]
+            results[name] = {
+                'cold_ms': round(cold_ms, 3),
+                'cold_queries': cold_queries,
+                'p50_ms': round(percentile(timings, 50), 3),
+                'p90_ms': round(percentile(timings, 90), 3),
+                'p99_ms': round(percentile(timings, 99), 3),
+                'mean_ms': round(statistics.mean(timings), 3),
+                'max_ms': round(max(timings), 3),
+                'queries': round(statistics.median(queries)),
+                'max_queries': max(queries),
+            }
+            self.stderr.write(f'{name}: p50 {results[name]["p50_ms"]} ms, {results[name]["queries"]} queries')
+        return results
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.candidates import refresh_restaurants_on_commit
+from foodcartapp.models import Restaurant
+from foodcartapp.spatial import VERSION_NAME, locate_restaurants
+from foodcartapp.versions import bump_version
+
+
+class Command(BaseCommand):
+    help = 'Fill coordinates of restaurants from their addresses, for restaurants without coordinates by default'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='locate all restaurants again')
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='how many restaurants to geocode at once')
+
+    def handle(self, *args, **options):
+        restaurants = Restaurant.objects.exclude(address='').order_by('id')
+        if not options['all']:
+            restaurants = restaurants.filter(lat__isnull=True) | restaurants.filter(lon__isnull=True)
+        restaurant_ids = list(restaurants.values_list('id', flat=True))
+        batch_size = options['batch_size']
+        unlocated_count = 0
+        for start in range(0, len(restaurant_ids), batch_size):
+            batch = list(Restaurant.objects.filter(id__in=restaurant_ids[start:start + batch_size]))
+            with transaction.atomic():
+                unlocated_count += len(locate_restaurants(batch))
+                Restaurant.objects.bulk_update(batch, ['lat', 'lon'])
+                transaction.on_commit(lambda: bump_version(VERSION_NAME))
+                refresh_restaurants_on_commit(restaurant.id for restaurant in batch)
+        self.stdout.write(
+            f'Located restaurants: {len(restaurant_ids) - unlocated_count}, without coordinates: {unlocated_count}'
+        )
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Fill stored totals of orders from their products, batch by batch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='orders checked by one query')
+        parser.add_argument('--check', action='store_true', help='only report orders with wrong total')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        checked = 0
+        mismatched = 0
+        last_id = 0
+        while True:
+            batch = Order.objects.filter(id__gt=last_id).order_by('id')[:batch_size]
+            order_ids = list(batch.values_list('id', flat=True))
+            if not order_ids:
+                break
+            last_id = order_ids[-1]
+            wrong_totals = list(
+                Order.objects
+                    .filter(id__in=order_ids)
+                    .with_calculated_total()
+                    .exclude(total=F('calculated_total'))
+                    .values_list('id', 'total', 'calculated_total')
+            )
+            if options['check']:
+                for order_id, total, calculated_total in wrong_totals:
+                    self.stdout.write(f'Order {order_id}: stored {total}, calculated {calculated_total}')
+            elif wrong_totals:
+                Order.objects.filter(id__in=[order_id for order_id, _, _ in wrong_totals]).recalculate_totals()
+            checked += len(order_ids)
+            mismatched += len(wrong_totals)
+
+        if options['check'] and mismatched:
+            raise CommandError(f'Checked orders: {checked}. Wrong totals: {mismatched}')
+        self.stdout.write(f'Checked orders: {checked}. Fixed totals: {mismatched}')
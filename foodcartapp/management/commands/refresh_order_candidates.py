@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.candidates import refresh_candidates
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Recalculate restaurants which can cook orders, for orders in START status by default'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='recalculate for orders in any status')
+
+    def handle(self, *args, **options):
+        orders = Order.objects.all() if options['all'] else Order.objects.filter(status='START')
+        order_ids = list(orders.order_by('id').values_list('id', flat=True))
+        refresh_candidates(order_ids)
+        self.stdout.write(f'Recalculated orders: {len(order_ids)}')
@@ -0,0 +1,36 @@
+# Generated by Django 3.2 on 2026-10-18 18:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0054_order_status_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderCandidate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('distance', models.FloatField(blank=True, null=True, verbose_name='Расстояние, км')),
+                ('rank', models.PositiveIntegerField(verbose_name='Место по удаленности')),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidates', to='foodcartapp.order', verbose_name='Заказ')),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_candidates', to='foodcartapp.restaurant', verbose_name='Ресторан')),
+            ],
+            options={
+                'verbose_name': 'ресторан, способный приготовить заказ',
+                'verbose_name_plural': 'рестораны, способные приготовить заказ',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='ordercandidate',
+            index=models.Index(fields=['order', 'rank'], name='foodcartapp_order_i_7f08f5_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='ordercandidate',
+            unique_together={('order', 'restaurant')},
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0056_order_updated'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['phonenumber'], name='order_phone_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
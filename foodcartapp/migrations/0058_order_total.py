@@ -0,0 +1,40 @@
+# Generated by Django 3.2 on 2026-10-18 18:17
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_totals(apps, schema_editor):
+    """Same as OrderQuerySet.recalculate_totals, copied here to not depend on current models"""
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderedProduct = apps.get_model('foodcartapp', 'OrderedProduct')
+    totals = OrderedProduct.objects \
+        .filter(order=models.OuterRef('pk')) \
+        .values('order') \
+        .annotate(total=models.Sum(
+            models.ExpressionWrapper(models.F('cost') * models.F('quantity'), output_field=models.DecimalField())
+        )) \
+        .values('total')
+    Order.objects.update(total=Coalesce(
+        models.Subquery(totals, output_field=models.DecimalField()),
+        Decimal(0),
+        output_field=models.DecimalField(),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0057_order_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, max_digits=10, verbose_name='сумма'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
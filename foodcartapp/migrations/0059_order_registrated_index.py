@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 18:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0058_order_total'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='registrated',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время регистрации'),
+        ),
+    ]
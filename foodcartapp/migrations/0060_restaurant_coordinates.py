@@ -0,0 +1,78 @@
+# Generated by Django 3.2 on 2026-10-18 18:28
+
+import re
+
+from django.db import migrations, models
+
+# copy of geocoder.normalization, so later changes of it don't change this migration
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'ш': 'шоссе',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'обл': 'область',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'г': '',
+    'гор': '',
+    'город': '',
+    'д': '',
+    'дом': '',
+}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    tokens = TOKEN_PATTERN.findall(address.casefold().replace('ё', 'е'))
+    words = (ABBREVIATIONS.get(token, token) for token in tokens)
+    return ' '.join(word for word in words if word)
+
+
+def fill_coordinates(apps, schema_editor):
+    """Take coordinates of restaurants from already geocoded locations, the rest are left to locate_restaurants"""
+    Restaurant = apps.get_model('foodcartapp', 'Restaurant')
+    Location = apps.get_model('geocoder', 'Location')
+    restaurants = list(Restaurant.objects.exclude(address=''))
+    locations = {
+        normalized_address: (lon, lat)
+        for normalized_address, lon, lat in Location.objects
+        .filter(normalized_address__in={normalize_address(restaurant.address) for restaurant in restaurants})
+        .values_list('normalized_address', 'lon', 'lat')
+    }
+    for restaurant in restaurants:
+        restaurant.lon, restaurant.lat = locations.get(normalize_address(restaurant.address), (None, None))
+    Restaurant.objects.bulk_update(restaurants, ['lat', 'lon'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0059_order_registrated_index'),
+        ('geocoder', '0004_location_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='lat',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='широта'),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='lon',
+            field=models.FloatField(blank=True, editable=False, null=True, verbose_name='долгота'),
+        ),
+        migrations.RunPython(fill_coordinates, migrations.RunPython.noop),
+    ]
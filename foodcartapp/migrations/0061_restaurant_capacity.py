@@ -0,0 +1,18 @@
+# Generated by Django 3.2 on 2026-10-18 18:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0060_restaurant_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='capacity',
+            field=models.PositiveIntegerField(default=10, help_text='сколько заказов в работе ресторан успевает готовить, см. foodcartapp.assignment', verbose_name='заказов одновременно'),
+        ),
+    ]
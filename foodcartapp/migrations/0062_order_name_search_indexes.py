@@ -0,0 +1,36 @@
+# Generated by Django 3.2 on 2026-10-18 21:05
+
+from django.db import migrations
+
+# admin searches names with istartswith, PostgreSQL turns it into UPPER(column) LIKE 'ABC%'
+NAME_SEARCH_INDEXES = {
+    'order_firstname_upper_idx': 'firstname',
+    'order_lastname_upper_idx': 'lastname',
+}
+
+
+def create_name_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, column in NAME_SEARCH_INDEXES.items():
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS "{name}" ON "foodcartapp_order" (UPPER("{column}") varchar_pattern_ops)'
+        )
+
+
+def drop_name_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name in NAME_SEARCH_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0061_restaurant_capacity'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_search_indexes, drop_name_search_indexes),
+    ]
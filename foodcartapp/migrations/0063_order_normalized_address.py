@@ -0,0 +1,72 @@
+# Generated by Django 3.2 on 2026-10-19 09:12
+
+import re
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+# copy of geocoder.normalization, so later changes of it don't change this migration
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'ш': 'шоссе',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'обл': 'область',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'г': '',
+    'гор': '',
+    'город': '',
+    'д': '',
+    'дом': '',
+}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    tokens = TOKEN_PATTERN.findall(address.casefold().replace('ё', 'е'))
+    words = (ABBREVIATIONS.get(token, token) for token in tokens)
+    return ' '.join(word for word in words if word)
+
+
+def fill_normalized_addresses(apps, schema_editor):
+    Order = apps.get_model('foodcartapp', 'Order')
+    orders = []
+    for order in Order.objects.only('id', 'address').order_by('id').iterator(chunk_size=BATCH_SIZE):
+        order.normalized_address = normalize_address(order.address)
+        orders.append(order)
+        if len(orders) == BATCH_SIZE:
+            Order.objects.bulk_update(orders, ['normalized_address'])
+            orders = []
+    Order.objects.bulk_update(orders, ['normalized_address'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0062_order_name_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='normalized_address',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='см. geocoder.normalization',
+                                   max_length=200, verbose_name='Нормализованный адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_normalized_addresses, migrations.RunPython.noop),
+    ]
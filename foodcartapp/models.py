@@ -1,12 +1,17 @@
 from collections import defaultdict, namedtuple
+from decimal import Decimal
 
+import numpy as np
 from django.core.validators import MinValueValidator
 from django.db import models
+from django.db.models.functions import Coalesce
 from django.utils import timezone
-from geopy import distance
 from phonenumber_field.modelfields import PhoneNumberField
 
-from geocoder.models import Location, add_geocoder_addresses
+from geocoder.cache import get_locations
+from geocoder.distances import distance_matrix
+from geocoder.models import enqueue_addresses
+from geocoder.normalization import normalize_address
 
 
 class Restaurant(models.Model):
@@ -24,6 +29,23 @@ class Restaurant(models.Model):
         max_length=50,
         blank=True,
     )
+    lat = models.FloatField(
+        'широта',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    lon = models.FloatField(
+        'долгота',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+    capacity = models.PositiveIntegerField(
+        'заказов одновременно',
+        default=10,
+        help_text='сколько заказов в работе ресторан успевает готовить, см. foodcartapp.assignment',
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -129,74 +151,143 @@ class RestaurantMenuItem(models.Model):
         return f"{self.restaurant.name} - {self.product.name}"
 
 
+Resraurant_location = namedtuple('Resraurant_location', 'name distance')
+
+
 class OrderQuerySet(models.QuerySet):
-    def calc_can_cook(self):
+    @staticmethod
+    def _calculated_total():
+        totals = OrderedProduct.objects \
+            .filter(order=models.OuterRef('pk')) \
+            .values('order') \
+            .annotate(total=models.Sum(
+                models.ExpressionWrapper(models.F('cost') * models.F('quantity'), output_field=models.DecimalField())
+            )) \
+            .values('total')
+        return Coalesce(
+            models.Subquery(totals, output_field=models.DecimalField()),
+            Decimal(0),
+            output_field=models.DecimalField(),
+        )
+
+    def with_calculated_total(self):
+        """Annotate orders with total cost of their products, to check stored Order.total"""
+        return self.annotate(calculated_total=self._calculated_total())
+
+    def recalculate_totals(self):
+        """Restore stored Order.total from products with single UPDATE"""
+        return self.update(total=self._calculated_total(), updated=timezone.now())
+
+    def calc_can_cook_masks(self):
         """
         Calulate which restaurant can cook orders in current Order queryset
-        return: dict like this:
-            {order_id:[restaurant_id,restaurant_id,...] , order_id:[], ...}
+        using in-memory availability index (see foodcartapp.availability)
+        return: dict like this: {order_id: restaurants_bitset, ...}
         """
-        product_in_restaurants = defaultdict(set)
-        restaurant_query = RestaurantMenuItem.objects \
-            .filter(availability=True) \
-            .select_related('restaurant') \
-            .values_list('restaurant_id', 'product_id')
-        for restaurant, product in restaurant_query:
-            product_in_restaurants[product].add(restaurant)
+        from .availability import availability_index
+
         ordered_products = defaultdict(set)
-        orders_query = self.select_related('products') \
-            .values_list('id', 'products__product_id')
+        orders_query = self.values_list('id', 'products__product_id')
         for order, product in orders_query:
             ordered_products[order].add(product)
-        can_cook = {}
-        for order, products in ordered_products.items():
-            can_cook.update({
-                order: list(set.intersection(*[product_in_restaurants[product] for product in products]))
-            })
-        return can_cook
-
-    def can_cook_with_distance(self, restaurant_by_name=True):
+        return {order: availability_index.can_cook(products) for order, products in ordered_products.items()}
+
+    def calc_can_cook(self):
+        """
+        Calulate which restaurant can cook orders in current Order queryset
+        return: dict like this:
+            {order_id:[restaurant_id,restaurant_id,...] , order_id:[], ...}
+        """
+        from .availability import restaurants_from_mask
+
+        return {order: restaurants_from_mask(mask) for order, mask in self.calc_can_cook_masks().items()}
+
+    def can_cook_with_distance(self, restaurant_by_name=True, limit=None, radius=None):
         """
         Used calc_can_cook() and return: dict like this:
             {order_id:[namedtuple(name,distance), ...] , order_id:[], ...}
         where 'name' mean restaurant name, if restaurant_by_name=True else  restaurant id
-              'distance' - distance between addresses order and restaurant
+              'distance' - distance between addresses order and restaurant,
+                           None if coordinates of some address are unknown
+        limit, radius - return only `limit` nearest restaurants within `radius` km,
+                        they are found with spatial index (see foodcartapp.spatial)
+        Distances for all orders are calculated at once, see geocoder.distances
+        Restaurant coordinates are stored in Restaurant (see foodcartapp.spatial.locate_restaurants),
+        order addresses without known location are put into geocoding queue.
         """
+        if limit is not None or radius is not None:
+            return self._nearest_can_cook(restaurant_by_name, limit, radius)
+
         can_cook = self.calc_can_cook()
-        restaurant_ids = list(set.union(*[set(restaurant) for restaurant in can_cook.values()]))
-        restaurants_raw = Restaurant.objects.filter(id__in=restaurant_ids).values('id', 'address', 'name')
-        restaurants_names = {restaurant['id']: restaurant['name'] for restaurant in restaurants_raw}
-        restaurants_addreses = {restaurant['id']: restaurant['address'] for restaurant in restaurants_raw}
+        restaurant_ids = list(set().union(*can_cook.values()))
+        restaurants_raw = Restaurant.objects.filter(id__in=restaurant_ids).values_list('id', 'name', 'lat', 'lon')
+        restaurants_names = {}
+        restaurants_points = {}
+        for restaurant, name, lat, lon in restaurants_raw:
+            restaurants_names[restaurant] = name
+            restaurants_points[restaurant] = (lat, lon)
         order_ids = can_cook.keys()
         orders = Order.objects.filter(id__in=order_ids).values('id', 'address')
         orders_addresses = {order['id']: order['address'] for order in orders}
-        used_addresses = set(list(orders_addresses.values()) + list(restaurants_addreses.values()))
-
-        geo_addresses = {}
-        geo_query = Location.objects \
-            .filter(address__in=list(used_addresses)) \
-            .values_list('address', 'lon', 'lat')
-        for address, lon, lat in geo_query:
-            geo_addresses.update({address: (lon, lat)})
-            used_addresses.discard(address)
+        used_addresses = set(orders_addresses.values())
+
+        geo_addresses = get_locations(used_addresses)
+        used_addresses.difference_update(geo_addresses)
         if len(used_addresses) > 0:
-            new_geo_addresses = add_geocoder_addresses(used_addresses)
-            geo_addresses.update(new_geo_addresses)
+            enqueue_addresses(used_addresses)
+
+        def lat_lon(address):
+            lon, lat = geo_addresses.get(address, (None, None))
+            return lat, lon
+
+        order_rows = {order: row for row, order in enumerate(can_cook)}
+        restaurant_columns = {restaurant: column for column, restaurant in enumerate(restaurants_points)}
+        distances = distance_matrix(
+            [lat_lon(orders_addresses[order]) for order in can_cook],
+            list(restaurants_points.values()),
+        )
 
         new_can_cook = {}
-        Resraurant_location = namedtuple('Resraurant_location', 'name distance')
-        restaurant_locations = {restaurant: geo_addresses[address]
-                                for restaurant, address in restaurants_addreses.items()}
         for order, restaurants in can_cook.items():
-            order_location = geo_addresses[orders_addresses[order]]
-            new_can_cook.update({order: []})
-            for restaurant in restaurants:
-                new_can_cook[order].append(Resraurant_location(
-                    restaurants_names[restaurant] if restaurant_by_name else restaurant,
-                    distance.distance(order_location, restaurant_locations[restaurant]).km)
-                    )
-            if len(new_can_cook[order]) > 0:
-                new_can_cook[order].sort(key=lambda r: r[1])
+            order_distances = distances[order_rows[order], [restaurant_columns[r] for r in restaurants]]
+            new_can_cook[order] = [
+                Resraurant_location(
+                    restaurants_names[restaurants[index]] if restaurant_by_name else restaurants[index],
+                    None if np.isnan(order_distances[index]) else float(order_distances[index]),
+                )
+                for index in np.argsort(order_distances, kind='stable')
+            ]
+        return new_can_cook
+
+    def _nearest_can_cook(self, restaurant_by_name, limit, radius):
+        from .availability import restaurants_from_mask
+        from .spatial import restaurant_index
+
+        can_cook = self.calc_can_cook_masks()
+        orders_addresses = dict(Order.objects.filter(id__in=can_cook.keys()).values_list('id', 'address'))
+        geo_addresses = get_locations(orders_addresses.values())
+        unknown_addresses = set(orders_addresses.values()).difference(geo_addresses)
+        if unknown_addresses:
+            enqueue_addresses(unknown_addresses)
+        positions = restaurant_index.get_positions()
+
+        new_can_cook = {}
+        for order, restaurants_mask in can_cook.items():
+            lon, lat = geo_addresses.get(orders_addresses[order], (None, None))
+            if lon is None or lat is None:
+                nearest = []
+                unlocated = restaurants_from_mask(restaurants_mask)
+            else:
+                nearest = positions.nearest(lat, lon, restaurants_mask, limit, radius)
+                unlocated = [restaurant for restaurant in positions.unlocated if restaurants_mask >> restaurant & 1]
+            restaurants = nearest + [(restaurant, None) for restaurant in unlocated]
+            new_can_cook[order] = [
+                Resraurant_location(
+                    positions.names.get(restaurant, restaurant) if restaurant_by_name else restaurant,
+                    restaurant_distance,
+                )
+                for restaurant, restaurant_distance in restaurants[:limit]
+            ]
         return new_can_cook
 
 
@@ -220,20 +311,41 @@ class Order(models.Model):
     lastname = models.CharField('Фамилия', max_length=50, db_index=True)
     phonenumber = PhoneNumberField('Телефон', db_index=True)
     address = models.CharField('Адрес', max_length=100, db_index=True)
+    normalized_address = models.CharField('Нормализованный адрес', max_length=200, db_index=True, editable=False,
+                                          help_text='см. geocoder.normalization')
     comment = models.TextField('Комментарий', blank=True)
-    registrated = models.DateTimeField('Время регистрации', default=timezone.now)
+    registrated = models.DateTimeField('Время регистрации', default=timezone.now, db_index=True)
     called = models.DateTimeField('Время созвона', null=True, blank=True)
     delivered = models.DateTimeField('Время доставки', null=True, blank=True)
+    updated = models.DateTimeField('Время изменения', auto_now=True, db_index=True)
+    total = models.DecimalField(
+        'сумма',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        editable=False,
+    )
 
     objects = OrderQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            # prefix search (LIKE 'abc%') in admin, opclasses are used by PostgreSQL only.
+            # Case insensitive search by names uses UPPER(...) indexes, see migration 0062
+            models.Index(fields=['phonenumber'], name='order_phone_prefix_idx', opclasses=['varchar_pattern_ops']),
+        ]
 
     def __str__(self):
         return (f'{self.id} ({self.firstname} {self.lastname} тел.{self.phonenumber}, {self.address})')
 
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        super().save(*args, **kwargs)
+
 
 class OrderedProduct(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='products', verbose_name='Заказ')
@@ -260,3 +372,24 @@ class OrderedProduct(models.Model):
 
     def __str__(self):
         return f"{self.product.name} - {self.quantity} шт. (заказ № {self.order.pk} )"
+
+
+class OrderCandidate(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='candidates', verbose_name='Заказ')
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='order_candidates',
+                                   verbose_name='Ресторан')
+    distance = models.FloatField('Расстояние, км', null=True, blank=True)
+    rank = models.PositiveIntegerField('Место по удаленности')
+
+    class Meta:
+        verbose_name = 'ресторан, способный приготовить заказ'
+        verbose_name_plural = 'рестораны, способные приготовить заказ'
+        unique_together = [
+            ['order', 'restaurant']
+        ]
+        indexes = [
+            models.Index(fields=['order', 'rank']),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant.name} - заказ № {self.order_id}"
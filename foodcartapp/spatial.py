@@ -0,0 +1,166 @@
+import threading
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from geopy.distance import EARTH_RADIUS
+from scipy.spatial import cKDTree
+
+from geocoder.cache import get_locations
+from geocoder.distances import distance_matrix
+from geocoder.models import add_geocoder_addresses, enqueue_addresses
+from geocoder.normalization import normalize_address
+from .models import Restaurant
+from .versions import bump_version, get_version
+
+VERSION_NAME = 'restaurants'
+
+
+def to_unit_vectors(points):
+    """Convert (lat, lon) in degrees to points on unit sphere, chord length grows with distance"""
+    lat, lon = np.radians(np.asarray(points, dtype=float).reshape(-1, 2)).T
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def chord_length(distance_km):
+    return 2 * np.sin(distance_km / (2 * EARTH_RADIUS))
+
+
+class RestaurantPositions:
+    """KD-tree over restaurant coordinates, immutable snapshot of RestaurantIndex"""
+
+    def __init__(self, restaurants):
+        located = []
+        self.unlocated = []
+        for restaurant, _, lat, lon in restaurants:
+            if lat is None or lon is None:
+                self.unlocated.append(restaurant)
+            else:
+                located.append((restaurant, lat, lon))
+        self.names = {restaurant: name for restaurant, name, _, _ in restaurants}
+        self.ids = np.array([restaurant for restaurant, _, _ in located], dtype=int)
+        self.points = np.array([(lat, lon) for _, lat, lon in located], dtype=float).reshape(-1, 2)
+        self.tree = cKDTree(to_unit_vectors(self.points)) if located else None
+
+    def nearest(self, lat, lon, restaurants_mask, limit=None, radius=None):
+        """
+        Find nearest restaurants from restaurants_mask bitset (see foodcartapp.availability)
+        KD-tree is asked for more and more neighbours until enough of them are in the mask.
+        return: list like this: [(restaurant_id, distance_km), ...] sorted by distance
+        """
+        if self.tree is None or not restaurants_mask:
+            return []
+        query_point = to_unit_vectors([(lat, lon)])[0]
+        upper_bound = chord_length(radius) if radius is not None else np.inf
+        restaurants_count = len(self.ids)
+        wanted = restaurants_count if limit is None else limit
+        neighbours_count = min(restaurants_count, max(2 * wanted, 8))
+        while True:
+            chords, positions = self.tree.query(
+                query_point,
+                k=np.arange(1, neighbours_count + 1),
+                distance_upper_bound=upper_bound,
+            )
+            found = positions[np.isfinite(chords)]
+            candidates = [position for position in found if restaurants_mask >> int(self.ids[position]) & 1]
+            exhausted = len(found) < neighbours_count or neighbours_count == restaurants_count
+            if len(candidates) >= wanted or exhausted:
+                break
+            neighbours_count = min(restaurants_count, neighbours_count * 2)
+
+        distances = distance_matrix([(lat, lon)], self.points[candidates])[0]
+        nearest = sorted(
+            (distance, int(self.ids[position])) for distance, position in zip(distances, candidates)
+            if radius is None or distance <= radius
+        )
+        return [(restaurant, float(distance)) for distance, restaurant in nearest[:limit]]
+
+
+class RestaurantIndex:
+    """
+    Per-process spatial index of restaurants. It is rebuilt when any
+    restaurant is saved or deleted (shared version counter, like availability index).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._positions = None
+
+    @staticmethod
+    def _build():
+        return RestaurantPositions(list(Restaurant.objects.values_list('id', 'name', 'lat', 'lon')))
+
+    def get_positions(self):
+        version = get_version(VERSION_NAME)
+        with self._lock:
+            if self._positions is None or self._version != version:
+                self._positions = self._build()
+                self._version = version
+            return self._positions
+
+
+restaurant_index = RestaurantIndex()
+
+
+def locate_restaurants(restaurants, geocode=True):
+    """
+    Set coordinates of restaurants (without saving them) from known locations of their addresses.
+    Unknown addresses are geocoded right away if geocode=True, those still unknown are put
+    into geocoding queue, restaurants get coordinates when the queue reaches them.
+    return: list of restaurants left without coordinates
+    """
+    addresses = {restaurant.address for restaurant in restaurants if restaurant.address}
+    locations = get_locations(addresses)
+    unknown_addresses = addresses.difference(locations)
+    if unknown_addresses and geocode:
+        locations.update(add_geocoder_addresses(unknown_addresses))
+        unknown_addresses.difference_update(locations)
+    if unknown_addresses:
+        enqueue_addresses(unknown_addresses)
+
+    unlocated = []
+    for restaurant in restaurants:
+        lon, lat = locations.get(restaurant.address, (None, None))
+        if lon is None or lat is None:
+            restaurant.lat, restaurant.lon = None, None
+            unlocated.append(restaurant)
+        else:
+            restaurant.lat, restaurant.lon = float(lat), float(lon)
+    return unlocated
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_index(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(VERSION_NAME))
+
+
+@receiver(post_save, sender=Restaurant)
+def enqueue_unlocated_restaurant(sender, instance, **kwargs):
+    if instance.address and (instance.lat is None or instance.lon is None):
+        enqueue_addresses([instance.address])
+
+
+def locate_geocoded_restaurants(addresses):
+    """
+    Set coordinates of restaurants without them at just geocoded addresses,
+    called by foodcartapp.candidates before candidates of their orders are refreshed
+    return: list of located restaurants
+    """
+    normalized_addresses = {normalize_address(address) for address in addresses}
+    restaurants = [
+        restaurant
+        for restaurant in Restaurant.objects.filter(Q(lat__isnull=True) | Q(lon__isnull=True)).exclude(address='')
+        if normalize_address(restaurant.address) in normalized_addresses
+    ]
+    if not restaurants:
+        return []
+    unlocated = locate_restaurants(restaurants, geocode=False)
+    located = [restaurant for restaurant in restaurants if restaurant not in unlocated]
+    if located:
+        Restaurant.objects.bulk_update(located, ['lat', 'lon'])
+        transaction.on_commit(lambda: bump_version(VERSION_NAME))
+    return located
@@ -0,0 +1,544 @@
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from geocoder.backends import FakeGeocoder
+from geocoder.cache import locations_lru
+from geocoder.models import GeocodingJob, Location
+from .admin import phonenumber_prefix
+from .assignment import assign_orders, plan_assignment
+from .availability import availability_index, restaurants_from_mask
+from .candidates import refresh_candidates
+from .models import Order, OrderCandidate, OrderedProduct, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .versions import bump_version
+
+ORDER_ADDRESS = 'Москва, Красная площадь, 1'
+
+
+def order_fields(products, **fields):
+    return {
+        'firstname': 'Иван',
+        'lastname': 'Петров',
+        'phonenumber': '+79161234567',
+        'address': ORDER_ADDRESS,
+        'products': [{'product': product.id, 'quantity': quantity} for product, quantity in products],
+        **fields,
+    }
+
+
+def register_order(client, address, products):
+    order = order_fields([(product, 1) for product in products], address=address)
+    response = client.post('/api/order/', order, content_type='application/json')
+    return response.json()['id']
+
+
+class MenuTestCase(TestCase):
+    """Restaurant whose menu is filled by add_to_menu, with on_commit updates of availability done"""
+
+    def setUp(self):
+        cache.clear()
+        self.restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская, 10')
+
+    def add_to_menu(self, products):
+        with self.captureOnCommitCallbacks(execute=True):
+            for product in products:
+                RestaurantMenuItem.objects.create(restaurant=self.restaurant, product=product)
+
+
+@override_settings(GEOCODER_BACKEND='geocoder.backends.FakeGeocoder')
+class RestaurantCoordinatesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        locations_lru.clear()
+
+    def test_admin_locates_saved_restaurant(self):
+        admin = User.objects.create_superuser('admin', password='password')
+        self.client.force_login(admin)
+        response = self.client.post('/admin/foodcartapp/restaurant/add/', {
+            'name': 'Star Burger',
+            'address': 'Москва, Тверская, 10',
+            'contact_phone': '',
+            'capacity': 10,
+            'menu_items-TOTAL_FORMS': 0,
+            'menu_items-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        restaurant = Restaurant.objects.get()
+        lon, lat = FakeGeocoder().geocode('Москва, Тверская, 10')
+        self.assertEqual((restaurant.lat, restaurant.lon), (lat, lon))
+        self.assertFalse(GeocodingJob.objects.exists())
+
+    def test_command_fills_coordinates_from_known_locations(self):
+        Location.objects.create(address='г. Москва, Тверская, д. 10', lon=37.607826, lat=55.761585)
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская, 10')
+        call_command('locate_restaurants', stdout=StringIO())
+        restaurant.refresh_from_db()
+        self.assertEqual((restaurant.lat, restaurant.lon), (55.761585, 37.607826))
+
+    def test_queued_restaurant_is_located_by_worker(self):
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская, 10')
+        self.assertTrue(GeocodingJob.objects.filter(address='Москва, Тверская, 10').exists())
+        call_command('geocode_worker', '--once', stdout=StringIO())
+        restaurant.refresh_from_db()
+        self.assertIsNotNone(restaurant.lat)
+
+
+@override_settings(MANAGER_CANDIDATES_LIMIT=1)
+class OrderAssignmentTest(TestCase):
+    """Only the nearest candidate is stored, assignment has to look beyond it"""
+
+    def setUp(self):
+        cache.clear()
+        locations_lru.clear()
+        self.near = Restaurant.objects.create(name='Рядом', address='Рядом', lat=55.75, lon=37.62, capacity=2)
+        self.far = Restaurant.objects.create(name='Далеко', address='Далеко', lat=55.80, lon=37.62, capacity=5)
+        burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        cola = Product.objects.create(name='Кола', price=50, image='cola.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            for restaurant in [self.near, self.far]:
+                RestaurantMenuItem.objects.create(restaurant=restaurant, product=burger)
+            RestaurantMenuItem.objects.create(restaurant=self.far, product=cola)
+        # order 0 can be cooked only far away, order 3 has unknown address,
+        # orders 1 and 2 are nearest to the same restaurant which has one free slot
+        for address, lat in [('Заказ 0', 55.79), ('Заказ 1', 55.76), ('Заказ 2', 55.75)]:
+            Location.objects.create(address=address, lat=lat, lon=37.62)
+        self.orders = []
+        for number, products in enumerate([[burger, cola], [burger], [burger], [burger]]):
+            order = Order.objects.create(
+                firstname='Иван', lastname='Петров', phonenumber='+79161234567', address=f'Заказ {number}',
+            )
+            for product in products:
+                OrderedProduct.objects.create(order=order, product=product, quantity=1, cost=product.price)
+            self.orders.append(order)
+        Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79161234567', address='Москва',
+            status='WORK', restaurant=self.near,
+        )
+
+    def test_plan_respects_capacity(self):
+        assignments = plan_assignment(Order.objects.all())
+        self.assertEqual(
+            sorted((assignment.order, assignment.restaurant) for assignment in assignments),
+            [(self.orders[0].id, self.far.id), (self.orders[1].id, self.far.id), (self.orders[2].id, self.near.id)],
+        )
+        # the nearest restaurant goes to order 2, which would be farther from the other one
+        self.assertAlmostEqual(sum(assignment.distance for assignment in assignments), 1.11 + 4.45, places=1)
+
+    def test_assigned_orders_are_put_in_work(self):
+        self.assertEqual(assign_orders(Order.objects.all()), (3, 1))
+        self.assertEqual(Order.objects.get(id=self.orders[2].id).restaurant, self.near)
+        self.assertEqual(Order.objects.filter(status='WORK').count(), 4)
+        self.assertEqual(assign_orders(Order.objects.all()), (0, 1))
+
+
+@override_settings(MANAGER_CANDIDATES_LIMIT=2)
+class OrderCandidatesTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        locations_lru.clear()
+        Location.objects.create(address=ORDER_ADDRESS, lat=55.75, lon=37.62)
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.restaurants = [
+            Restaurant.objects.create(name=name, address=name, lat=55.75 + offset, lon=37.62)
+            for name, offset in [('Рядом', 0.01), ('Недалеко', 0.03), ('Далеко', 0.1)]
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_items = [
+                RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.product)
+                for restaurant in self.restaurants
+            ]
+            self.order_id = register_order(self.client, ORDER_ADDRESS, [self.product])
+
+    def candidates(self):
+        return list(
+            OrderCandidate.objects
+            .filter(order_id=self.order_id)
+            .order_by('rank')
+            .values_list('restaurant__name', flat=True)
+        )
+
+    def test_only_nearest_restaurants_are_stored(self):
+        self.assertEqual(self.candidates(), ['Рядом', 'Недалеко'])
+        distances = list(OrderCandidate.objects.order_by('rank').values_list('distance', flat=True))
+        self.assertAlmostEqual(distances[0], 1.11, places=2)
+        self.assertLess(distances[0], distances[1])
+
+    def test_menu_changes_of_transaction_refresh_once(self):
+        with mock.patch('foodcartapp.candidates.refresh_candidates', wraps=refresh_candidates) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    for menu_item in self.menu_items[:2]:
+                        menu_item.availability = False
+                        menu_item.save()
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(self.candidates(), ['Далеко'])
+
+    def test_rolled_back_menu_change_is_forgotten(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ZeroDivisionError), transaction.atomic():
+                self.menu_items[0].availability = False
+                self.menu_items[0].save()
+                1 / 0
+            self.menu_items[1].availability = False
+            self.menu_items[1].save()
+        self.assertEqual(self.candidates(), ['Рядом', 'Далеко'])
+
+    def test_moved_restaurant_becomes_nearest(self):
+        far = self.restaurants[2]
+        far.lat = 55.751
+        with self.captureOnCommitCallbacks(execute=True):
+            far.save()
+        self.assertEqual(self.candidates(), ['Далеко', 'Рядом'])
+
+    def test_deleted_restaurant_is_replaced(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurants[0].delete()
+        self.assertEqual(self.candidates(), ['Недалеко', 'Далеко'])
+
+    def test_admin_offers_all_capable_restaurants(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+        response = self.client.get(f'/admin/foodcartapp/order/{self.order_id}/change/')
+        choices = response.context['adminform'].form.fields['restaurant'].queryset
+        self.assertEqual([restaurant.name for restaurant in choices], ['Рядом', 'Недалеко', 'Далеко'])
+
+    def test_admin_saves_order_in_work(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+        restaurant = Restaurant.objects.create(name='Без меню', address='Москва')
+        order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79161234567', address=ORDER_ADDRESS,
+            status='WORK', restaurant=restaurant,
+        )
+        registrated = timezone.localtime(order.registrated)
+        response = self.client.post(f'/admin/foodcartapp/order/{order.id}/change/', {
+            'status': 'WORK',
+            'restaurant': restaurant.id,
+            'payment': 'CASH',
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': ORDER_ADDRESS,
+            'comment': '',
+            'registrated_0': registrated.date().isoformat(),
+            'registrated_1': registrated.time().isoformat(),
+            'products-TOTAL_FORMS': 0,
+            'products-INITIAL_FORMS': 0,
+        })
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual((order.restaurant, order.payment), (restaurant, 'CASH'))
+
+
+@override_settings(GEOCODER_BACKEND='geocoder.backends.FakeGeocoder')
+class GeocodedCandidatesTest(TransactionTestCase):
+    """Geocoding worker runs in autocommit mode, on_commit callbacks run at once"""
+
+    def setUp(self):
+        cache.clear()
+        locations_lru.clear()
+
+    def test_geocoded_restaurant_gets_candidate_distances(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        restaurant = Restaurant.objects.create(name='Star Burger', address='г. Москва, Тверская, д. 10')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        Location.objects.create(address=ORDER_ADDRESS, lat=55.75, lon=37.62)
+        order_id = register_order(self.client, ORDER_ADDRESS, [product])
+        self.assertIsNone(OrderCandidate.objects.get(order_id=order_id).distance)
+
+        call_command('geocode_worker', '--once', stdout=StringIO())
+
+        restaurant.refresh_from_db()
+        self.assertIsNotNone(restaurant.lat)
+        self.assertIsNotNone(OrderCandidate.objects.get(order_id=order_id).distance)
+
+    def test_order_with_other_spelling_gets_candidate_distances(self):
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва', lat=55.75, lon=37.62)
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        Location.objects.create(
+            address='Москва, Тверская, 10', state=Location.NOT_FOUND, failures=1, next_retry=timezone.now(),
+        )
+        order_id = register_order(self.client, 'г. Москва, Тверская, д. 10', [product])
+        self.assertIsNone(OrderCandidate.objects.get(order_id=order_id).distance)
+
+        call_command('retry_locations', stdout=StringIO())
+
+        self.assertIsNotNone(OrderCandidate.objects.get(order_id=order_id).distance)
+
+
+class OrderTotalTest(TestCase):
+    def setUp(self):
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.cola = Product.objects.create(name='Кола', price=50, image='cola.jpg')
+        self.order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79161234567', address=ORDER_ADDRESS,
+        )
+
+    def stored_total(self):
+        return Order.objects.get(id=self.order.id).total
+
+    def test_total_follows_ordered_products(self):
+        OrderedProduct.objects.create(order=self.order, product=self.burger, quantity=2, cost=100)
+        cola = OrderedProduct.objects.create(order=self.order, product=self.cola, quantity=1, cost=50)
+        self.assertEqual(self.stored_total(), Decimal(250))
+
+        cola.quantity = 3
+        cola.save()
+        self.assertEqual(self.stored_total(), Decimal(350))
+
+        cola.delete()
+        self.assertEqual(self.stored_total(), Decimal(200))
+        call_command('recalculate_order_totals', '--check', stdout=StringIO())
+
+    def test_registered_order_has_total(self):
+        cache.clear()
+        Location.objects.create(address=ORDER_ADDRESS, lat=55.75, lon=37.62)
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская, 10')
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.burger)
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.cola)
+            order_id = register_order(self.client, ORDER_ADDRESS, [self.burger, self.cola])
+        self.assertEqual(Order.objects.get(id=order_id).total, Decimal(150))
+
+    def test_admin_save_keeps_concurrent_total_change(self):
+        stale_order = Order.objects.get(id=self.order.id)
+        OrderedProduct.objects.create(order=self.order, product=self.burger, quantity=1, cost=100)
+        stale_order.comment = 'Позвонить заранее'
+        admin.site._registry[Order].save_model(None, stale_order, None, change=True)
+        self.assertEqual(self.stored_total(), Decimal(100))
+        self.assertEqual(Order.objects.get(id=self.order.id).comment, 'Позвонить заранее')
+
+
+class OrderSearchTest(TestCase):
+    def setUp(self):
+        self.petrov = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79161234567', address=ORDER_ADDRESS,
+        )
+        self.smith = Order.objects.create(
+            firstname='John', lastname='Smith', phonenumber='+74951234567', address=ORDER_ADDRESS,
+        )
+        self.order_admin = admin.site._registry[Order]
+
+    def search(self, search_term):
+        queryset, _ = self.order_admin.get_search_results(None, Order.objects.order_by('id'), search_term)
+        return list(queryset)
+
+    def test_phonenumber_prefix(self):
+        self.assertEqual(phonenumber_prefix('916 123'), '+7916123')
+        self.assertEqual(phonenumber_prefix('8 (916) 12'), '+791612')
+        self.assertEqual(phonenumber_prefix('7-916'), '+7916')
+        self.assertEqual(phonenumber_prefix('+1 202'), '+1202')
+        self.assertIsNone(phonenumber_prefix('()'))
+
+    def test_search_by_phone(self):
+        self.assertEqual(self.search('916 123'), [self.petrov])
+        self.assertEqual(self.search('8 (495)'), [self.smith])
+        self.assertEqual(self.search(str(self.smith.id)), [self.smith])
+
+    def test_search_by_names(self):
+        self.assertEqual(self.search('Пет'), [self.petrov])
+        self.assertEqual(self.search('Иван Пет'), [self.petrov])
+        self.assertEqual(self.search('Иван Смирнов'), [])
+        # SQLite can not convert letter case for cyrillic words, so case is checked on latin ones
+        self.assertEqual(self.search('smi'), [self.smith])
+        self.assertEqual(self.search('JOHN'), [self.smith])
+
+
+class AvailabilityIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        availability_index.clear()
+        self.first, self.second = [
+            Restaurant.objects.create(name=name, address=name) for name in ['Первый', 'Второй']
+        ]
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.cola = Product.objects.create(name='Кола', price=50, image='cola.jpg')
+        with self.captureOnCommitCallbacks(execute=True):
+            for restaurant in [self.first, self.second]:
+                RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.burger)
+            RestaurantMenuItem.objects.create(restaurant=self.first, product=self.cola)
+            self.unavailable_cola = RestaurantMenuItem.objects.create(
+                restaurant=self.second, product=self.cola, availability=False,
+            )
+
+    def can_cook(self, products):
+        return sorted(restaurants_from_mask(availability_index.can_cook(product.id for product in products)))
+
+    def test_restaurants_with_all_products(self):
+        self.assertEqual(self.can_cook([self.burger]), sorted([self.first.id, self.second.id]))
+        self.assertEqual(self.can_cook([self.burger, self.cola]), [self.first.id])
+        self.assertEqual(self.can_cook([]), [])
+
+    def test_menu_changes_patch_index(self):
+        self.can_cook([self.burger])
+        self.unavailable_cola.availability = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.unavailable_cola.save()
+            RestaurantMenuItem.objects.get(restaurant=self.first, product=self.burger).delete()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.can_cook([self.cola]), sorted([self.first.id, self.second.id]))
+            self.assertEqual(self.can_cook([self.burger]), [self.second.id])
+
+    def test_index_is_rebuilt_after_change_in_other_process(self):
+        self.can_cook([self.burger])
+        # queryset update sends no signals, like a change made by another process
+        RestaurantMenuItem.objects.filter(restaurant=self.second).update(availability=False)
+        self.assertEqual(self.can_cook([self.burger]), sorted([self.first.id, self.second.id]))
+
+        bump_version('availability')
+        self.assertEqual(self.can_cook([self.burger]), [self.first.id])
+
+
+class CatalogApiTest(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.add_to_menu([self.product])
+
+    def test_unchanged_catalog_is_not_modified(self):
+        response = self.client.get('/api/products/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([product['name'] for product in response.json()], ['Бургер'])
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/products/').status_code, 200)
+
+    def test_changed_catalog_is_sent_again(self):
+        etag = self.client.get('/api/products/')['ETag']
+        self.product.price = 120
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()[0]['price'], '120.00')
+
+    def test_etag_depends_on_query(self):
+        self.assertNotEqual(
+            self.client.get('/api/v2/products/')['ETag'],
+            self.client.get('/api/v2/products/', {'fields': 'id,name'})['ETag'],
+        )
+
+
+class ProductListV2Test(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        self.drinks = ProductCategory.objects.create(name='Напитки')
+        self.products = [
+            Product.objects.create(
+                name=f'Товар {number}', price=100 + number, image='burger.jpg',
+                category=self.drinks if number % 2 else None,
+            )
+            for number in range(5)
+        ]
+        Product.objects.create(name='Нет в меню', price=100, image='burger.jpg')
+        self.add_to_menu(self.products)
+
+    def test_pages_follow_cursor(self):
+        ids = []
+        url, params = '/api/v2/products/', {'limit': 2}
+        while url:
+            page = self.client.get(url, params).json()
+            self.assertLessEqual(len(page['results']), 2)
+            ids.extend(product['id'] for product in page['results'])
+            url, params = page['next'], None
+        self.assertEqual(ids, [product.id for product in self.products])
+
+    def test_fields_and_filters(self):
+        response = self.client.get('/api/v2/products/', {'fields': 'id,category', 'category': self.drinks.id})
+        self.assertEqual(response.json()['results'], [
+            {'id': product.id, 'category': {'id': self.drinks.id, 'name': 'Напитки'}}
+            for product in self.products[1::2]
+        ])
+
+        response = self.client.get('/api/v2/products/', {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.json())
+
+
+class OrderBatchApiTest(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.cola = Product.objects.create(name='Кола', price=50, image='cola.jpg')
+        self.unavailable = Product.objects.create(name='Нет в меню', price=10, image='burger.jpg')
+        self.add_to_menu([self.burger, self.cola])
+
+    def post_batch(self, orders):
+        return self.client.post('/api/order/batch/', orders, content_type='application/json')
+
+    def test_invalid_orders_are_skipped(self):
+        response = self.post_batch([
+            order_fields([(self.burger, 2), (self.cola, 1)]),
+            order_fields([(self.burger, 1)], phonenumber='123'),
+            order_fields([(self.unavailable, 1)]),
+            order_fields([(self.burger, 1), (self.burger, 2)]),
+            order_fields([], firstname='Пётр'),
+        ])
+        self.assertEqual(response.status_code, 200)
+        first, bad_phone, unavailable, repeated, empty = response.json()
+        self.assertEqual(set(first), {'id', 'firstname', 'lastname', 'phonenumber', 'address'})
+        self.assertIn('phonenumber', bad_phone['errors'])
+        self.assertEqual(
+            unavailable['errors']['products'],
+            [{'product': [f'Товар {self.unavailable.id} недоступен для заказа']}],
+        )
+        self.assertIn('products', repeated['errors'])
+        self.assertIn('products', empty['errors'])
+
+        order = Order.objects.get()
+        self.assertEqual(order.id, first['id'])
+        self.assertEqual(order.total, Decimal(250))
+        self.assertEqual(
+            set(order.products.values_list('product_id', 'quantity', 'cost')),
+            {(self.burger.id, 2, Decimal(100)), (self.cola.id, 1, Decimal(50))},
+        )
+
+    @override_settings(ORDERS_BATCH_MAX_SIZE=2)
+    def test_malformed_batch_is_rejected(self):
+        self.assertEqual(self.post_batch(order_fields([(self.burger, 1)])).status_code, 400)
+        self.assertEqual(self.post_batch([order_fields([(self.burger, 1)])] * 3).status_code, 400)
+        self.assertEqual(self.post_batch(['заказ', {'products': [{'product': 'бургер'}]}]).status_code, 200)
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderQueriesTest(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        self.products = [
+            Product.objects.create(name=f'Товар {number}', price=100, image='burger.jpg') for number in range(5)
+        ]
+        self.add_to_menu(self.products)
+
+    def assertQueriesDontGrowWithCart(self, url, make_payload):
+        with CaptureQueriesContext(connection) as single_product_queries:
+            response = self.client.post(url, make_payload(self.products[:1]), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(len(single_product_queries)):
+            response = self.client.post(url, make_payload(self.products), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_register_order(self):
+        self.assertQueriesDontGrowWithCart(
+            '/api/order/',
+            lambda products: order_fields([(product, 1) for product in products]),
+        )
+
+    def test_register_orders_batch(self):
+        self.assertQueriesDontGrowWithCart(
+            '/api/order/batch/',
+            lambda products: [order_fields([(product, 1) for product in products])] * 3,
+        )
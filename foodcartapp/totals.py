@@ -0,0 +1,42 @@
+from django.db.models import F
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Order, OrderedProduct
+
+
+def line_cost(ordered_product):
+    if ordered_product.cost is None or ordered_product.quantity is None:
+        return 0
+    return ordered_product.cost * ordered_product.quantity
+
+
+def add_to_total(order_id, amount):
+    """Shift stored Order.total by amount with single UPDATE, without reading the order"""
+    if order_id is None or not amount:
+        return
+    Order.objects.filter(id=order_id).update(total=F('total') + amount, updated=timezone.now())
+
+
+@receiver(post_init, sender=OrderedProduct)
+def remember_ordered_product_cost(sender, instance, **kwargs):
+    instance._counted_in_total = (instance.order_id, line_cost(instance)) if instance.pk else (None, 0)
+
+
+@receiver(post_save, sender=OrderedProduct)
+def update_total_on_save(sender, instance, **kwargs):
+    old_order, old_cost = instance._counted_in_total
+    new_cost = line_cost(instance)
+    if old_order == instance.order_id:
+        add_to_total(instance.order_id, new_cost - old_cost)
+    else:
+        add_to_total(old_order, -old_cost)
+        add_to_total(instance.order_id, new_cost)
+    instance._counted_in_total = (instance.order_id, new_cost)
+
+
+@receiver(post_delete, sender=OrderedProduct)
+def update_total_on_delete(sender, instance, **kwargs):
+    old_order, old_cost = instance._counted_in_total
+    add_to_total(old_order, -old_cost)
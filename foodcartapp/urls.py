@@ -1,11 +1,13 @@
 from django.urls import path
 
-from .views import product_list_api, banners_list_api, register_order
+from .views import product_list_api, product_list_api_v2, banners_list_api, register_order, register_orders_batch
 
 app_name = "foodcartapp"
 
 urlpatterns = [
     path('products/', product_list_api),
+    path('v2/products/', product_list_api_v2),
     path('banners/', banners_list_api),
     path('order/', register_order),
+    path('order/batch/', register_orders_batch),
 ]
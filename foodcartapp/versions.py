@@ -0,0 +1,32 @@
+import random
+
+from django.core.cache import cache
+
+VERSION_KEY_PREFIX = 'foodcartapp:version'
+
+
+def _version_key(name):
+    return f'{VERSION_KEY_PREFIX}:{name}'
+
+
+def get_version(name):
+    """
+    Return shared version counter, common for all worker processes.
+    A lost counter restarts from a random value, so stale data cached under
+    an old version is never mistaken for fresh one.
+    """
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, random.randint(1, 2 ** 31), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Increment shared version counter and return new value"""
+    key = _version_key(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        return get_version(name)
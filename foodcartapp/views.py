@@ -1,10 +1,22 @@
-from django.db import transaction
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.http import HttpResponse, JsonResponse
 from django.templatetags.static import static
-from rest_framework.decorators import api_view
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from rest_framework.decorators import api_view, renderer_classes
+from rest_framework.pagination import CursorPagination
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import (
+    BooleanField, CharField, IntegerField, ModelSerializer, Serializer, ValidationError,
+)
 
+from geocoder.models import enqueue_addresses
+from geocoder.normalization import normalize_address
+from .candidates import refresh_candidates
+from .catalog import catalog_etag, get_cached_catalog
 from .models import Product, Order, OrderedProduct
 
 
@@ -32,7 +44,7 @@ def banners_list_api(request):
     })
 
 
-def product_list_api(request):
+def dump_products():
     products = Product.objects.select_related('category').available()
 
     dumped_products = []
@@ -57,16 +69,106 @@ def product_list_api(request):
     return JsonResponse(dumped_products, safe=False, json_dumps_params={
         'ensure_ascii': False,
         'indent': 4,
-    })
+    }).content
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=catalog_etag)
+def product_list_api(request):
+    return HttpResponse(get_cached_catalog('products', dump_products), content_type='application/json')
+
+
+class ProductsCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+
+class ProductsQuerySerializer(Serializer):
+    PRODUCT_FIELDS = {
+        'id': ['id'],
+        'name': ['name'],
+        'price': ['price'],
+        'special_status': ['special_status'],
+        'description': ['description'],
+        'category': ['category_id', 'category__name'],
+        'image': ['image'],
+    }
+    DEFAULT_FIELDS = 'id,name,price,image'
+
+    fields = CharField(required=False, default=DEFAULT_FIELDS)
+    category = IntegerField(required=False)
+    special_status = BooleanField(required=False, allow_null=True, default=None)
+
+    def validate_fields(self, value):
+        fields = [field.strip() for field in value.split(',') if field.strip()]
+        unknown_fields = set(fields).difference(self.PRODUCT_FIELDS)
+        if unknown_fields or not fields:
+            raise ValidationError(f'Доступные поля: {", ".join(self.PRODUCT_FIELDS)}')
+        return fields
+
+
+def dump_product_fields(product, fields):
+    dumped_product = {}
+    for field in fields:
+        if field == 'category':
+            dumped_product['category'] = {
+                'id': product['category_id'],
+                'name': product['category__name'],
+            } if product['category_id'] else None
+        elif field == 'image':
+            dumped_product['image'] = default_storage.url(product['image']) if product['image'] else None
+        else:
+            dumped_product[field] = product[field]
+    return dumped_product
+
+
+@cache_control(no_cache=True)
+@condition(etag_func=catalog_etag)
+@api_view(['GET'])
+@renderer_classes([JSONRenderer])
+def product_list_api_v2(request):
+    """
+    Compact product list with cursor pagination: ?cursor=...&limit=20
+    filters: ?category=<id>&special_status=true
+    projection: ?fields=id,name,price,image
+    """
+    query = ProductsQuerySerializer(data=request.query_params.dict())
+    query.is_valid(raise_exception=True)
+    fields = query.validated_data['fields']
+
+    products = Product.objects.available()
+    if 'category' in query.validated_data:
+        products = products.filter(category_id=query.validated_data['category'])
+    if query.validated_data['special_status'] is not None:
+        products = products.filter(special_status=query.validated_data['special_status'])
+    columns = {'id'}.union(*[ProductsQuerySerializer.PRODUCT_FIELDS[field] for field in fields])
+    products = products.values(*columns)
+
+    paginator = ProductsCursorPagination()
+    page = paginator.paginate_queryset(products, request)
+    return paginator.get_paginated_response([dump_product_fields(product, fields) for product in page])
 
 
 class ProductsSerializer(ModelSerializer):
+    product = IntegerField(min_value=1)
+
     class Meta:
         model = OrderedProduct
         fields = ['product', 'quantity']
 
 
+def fetch_products(product_ids):
+    """Available products with prices by one query: {product_id: product, ...}"""
+    return Product.objects.available().only('id', 'price').in_bulk(product_ids)
+
+
 class OrderSerializer(ModelSerializer):
+    """
+    Products of order are resolved by one query, or taken from
+    context['products'] prefetched with fetch_products() for many orders
+    """
     products = ProductsSerializer(many=True, allow_empty=False, write_only=True)
 
     class Meta:
@@ -74,16 +176,92 @@ class OrderSerializer(ModelSerializer):
         read_only_fields = ['id']
         fields = ['id', 'firstname', 'lastname', 'phonenumber', 'address', 'products']
 
+    def validate_products(self, value):
+        product_ids = [fields['product'] for fields in value]
+        if len(product_ids) != len(set(product_ids)):
+            raise ValidationError('Товары в заказе повторяются')
+        products = self.context.get('products')
+        if products is None:
+            products = fetch_products(product_ids)
+        errors = [
+            {} if fields['product'] in products else {'product': [f'Товар {fields["product"]} недоступен для заказа']}
+            for fields in value
+        ]
+        if any(errors):
+            raise ValidationError(errors)
+        return [{**fields, 'product': products[fields['product']]} for fields in value]
+
+
+def collect_product_ids(orders):
+    """Product ids from raw (not validated yet) orders data"""
+    product_ids = set()
+    for order in orders:
+        if not isinstance(order, dict) or not isinstance(order.get('products'), list):
+            continue
+        for fields in order['products']:
+            try:
+                product_ids.add(int(fields['product']))
+            except (TypeError, KeyError, ValueError):
+                continue
+    return product_ids
+
+
+def save_orders(validated_orders):
+    """
+    Save validated OrderSerializer data: all orders with one INSERT when database
+    returns ids of inserted rows (PostgreSQL), then all their products with another one.
+    bulk_create skips Order.save and signals of foodcartapp.totals, so normalized address
+    and Order.total are set here.
+    """
+    orders = [
+        Order(
+            **{field: validated_order[field] for field in ['firstname', 'lastname', 'phonenumber', 'address']},
+            normalized_address=normalize_address(validated_order['address']),
+            total=sum(fields['product'].price * fields['quantity'] for fields in validated_order['products']),
+        )
+        for validated_order in validated_orders
+    ]
+    if connection.features.can_return_rows_from_bulk_insert:
+        Order.objects.bulk_create(orders)
+    else:
+        for order in orders:
+            order.save()
+    ordered_products = [OrderedProduct(order=order, cost=fields['product'].price, **fields)
+                        for order, validated_order in zip(orders, validated_orders)
+                        for fields in validated_order['products']]
+    OrderedProduct.objects.bulk_create(ordered_products)
+    addresses = {order.address for order in orders}
+    transaction.on_commit(lambda: enqueue_addresses(addresses))
+    order_ids = [order.id for order in orders]
+    transaction.on_commit(lambda: refresh_candidates(order_ids))
+    return orders
+
 
 @api_view(['POST'])
 @transaction.atomic
 def register_order(request):
     serializer = OrderSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
-    serialized_order = {field: serializer.validated_data[field]
-                        for field in ['firstname', 'lastname', 'phonenumber', 'address']}
-    order = Order.objects.create(**serialized_order)
-    ordered_products = [OrderedProduct(order=order, cost=fields['product'].price, **fields)
-                        for fields in serializer.validated_data['products']]
-    OrderedProduct.objects.bulk_create(ordered_products)
+    order, = save_orders([serializer.validated_data])
     return Response(OrderSerializer(order).data)
+
+
+@api_view(['POST'])
+@transaction.atomic
+def register_orders_batch(request):
+    """
+    Register list of orders at once, invalid orders are skipped
+    return: list like this: [{"id": 1, ...}, {"errors": {...}}, ...] in the order of request
+    """
+    if not isinstance(request.data, list):
+        raise ValidationError({'non_field_errors': ['Ожидается список заказов']})
+    if len(request.data) > settings.ORDERS_BATCH_MAX_SIZE:
+        raise ValidationError({'non_field_errors': [f'Не более {settings.ORDERS_BATCH_MAX_SIZE} заказов за раз']})
+    products = fetch_products(collect_product_ids(request.data))
+    serializers = [OrderSerializer(data=order, context={'products': products}) for order in request.data]
+    valid_serializers = [serializer for serializer in serializers if serializer.is_valid()]
+    orders = iter(save_orders([serializer.validated_data for serializer in valid_serializers]))
+    return Response([
+        {'errors': serializer.errors} if serializer.errors else OrderSerializer(next(orders)).data
+        for serializer in serializers
+    ])
@@ -0,0 +1,104 @@
+"""
+Geocoder backends, the one in use is set by GEOCODER_BACKEND setting.
+Backend is a class with method geocode(address) returning (lon, lat) -
+strings or floats, or (None, None) if address is not found.
+It raises GeocoderError when geocoder can't answer right now.
+"""
+import csv
+import hashlib
+import threading
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from requests.adapters import HTTPAdapter
+
+
+class GeocoderError(Exception):
+    """Geocoder is unavailable, address should be geocoded later"""
+
+
+class GeocoderCircuitOpen(GeocoderError):
+    """Geocoder has failed too often recently, it is not called for a while, see geocoder.breaker"""
+
+
+class YandexGeocoder:
+    """Yandex HTTP geocoder, keep-alive connections are shared by all geocoder threads"""
+
+    def __init__(self, apikey=None, url=None):
+        self.apikey = apikey or settings.YANDEX_KEY
+        self.url = url or settings.YANDEX_GEOCODER_URL
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=settings.GEOCODER_WORKERS)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def geocode(self, address):
+        try:
+            response = self.session.get(self.url, params={
+                "geocode": address,
+                "apikey": self.apikey,
+                "format": "json",
+            }, timeout=(settings.GEOCODER_CONNECT_TIMEOUT, settings.GEOCODER_READ_TIMEOUT))
+            response.raise_for_status()
+        except requests.RequestException as error:
+            raise GeocoderError(error) from error
+        try:
+            found_places = response.json()['response']['GeoObjectCollection']['featureMember']
+            if not found_places:
+                return None, None
+            most_relevant = found_places[0]
+            lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
+        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as error:
+            # malformed or error body, e.g. {"error": ...} with status 200
+            raise GeocoderError(f'Unexpected geocoder response: {error!r}') from error
+        return lon, lat
+
+
+class FixtureGeocoder:
+    """
+    Offline geocoder reading CSV file with columns address,lon,lat
+    (GEOCODER_FIXTURE_FILE), addresses missing in the file are not found
+    """
+
+    def __init__(self, path=None):
+        with open(path or settings.GEOCODER_FIXTURE_FILE, newline='', encoding='utf-8') as fixture:
+            self.locations = {row['address']: (row['lon'], row['lat']) for row in csv.DictReader(fixture)}
+
+    def geocode(self, address):
+        return self.locations.get(address, (None, None))
+
+
+class FakeGeocoder:
+    """Offline geocoder placing any address at stable point within ~10 km around center (lat, lon)"""
+
+    def __init__(self, center=(55.751244, 37.618423)):
+        self.center = center
+
+    def geocode(self, address):
+        digest = hashlib.md5(address.encode()).digest()
+        lat = self.center[0] + (digest[0] - 128) / 1280
+        lon = self.center[1] + (digest[1] - 128) / 800
+        return lon, lat
+
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+
+def get_geocoder():
+    global _geocoder
+    with _geocoder_lock:
+        if _geocoder is None:
+            _geocoder = import_string(settings.GEOCODER_BACKEND)()
+        return _geocoder
+
+
+@receiver(setting_changed)
+def reset_geocoder(setting, **kwargs):
+    global _geocoder
+    if setting.startswith(('GEOCODER_', 'YANDEX_')):
+        with _geocoder_lock:
+            _geocoder = None
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker with state in Django cache, so all processes stop calling
+    failing service together. GEOCODER_BREAKER_THRESHOLD failures within
+    GEOCODER_BREAKER_WINDOW seconds open it for GEOCODER_BREAKER_COOLDOWN
+    seconds, then single probe request is let through: its success closes
+    breaker, its failure opens it again.
+    """
+
+    def __init__(self, name):
+        self.failures_key = f'breaker:{name}:failures'
+        self.open_until_key = f'breaker:{name}:open_until'
+        self.probe_key = f'breaker:{name}:probe'
+
+    def is_open(self):
+        open_until = cache.get(self.open_until_key)
+        return open_until is not None and open_until > timezone.now().timestamp()
+
+    def allow_request(self):
+        open_until = cache.get(self.open_until_key)
+        if open_until is None:
+            return True
+        if open_until > timezone.now().timestamp():
+            return False
+        # half-open: only one process gets the probe, the rest keep failing fast
+        return cache.add(self.probe_key, True, timeout=settings.GEOCODER_BREAKER_COOLDOWN)
+
+    def record_success(self):
+        cache.delete_many([self.failures_key, self.open_until_key, self.probe_key])
+
+    def record_failure(self):
+        cache.add(self.failures_key, 0, timeout=settings.GEOCODER_BREAKER_WINDOW)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # key has expired between add and incr
+            failures = 1
+        probe_failed = cache.get(self.open_until_key) is not None
+        if probe_failed or failures >= settings.GEOCODER_BREAKER_THRESHOLD:
+            open_until = timezone.now().timestamp() + settings.GEOCODER_BREAKER_COOLDOWN
+            cache.set(self.open_until_key, open_until, timeout=None)
+            cache.delete_many([self.failures_key, self.probe_key])
+
+
+geocoder_breaker = CircuitBreaker('geocoder')
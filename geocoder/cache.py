@@ -0,0 +1,132 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Location
+from .normalization import normalize_address
+
+CACHE_KEY_PREFIX = 'geocoder:location'
+
+
+def _cache_key(normalized_address):
+    return f'{CACHE_KEY_PREFIX}:{hashlib.md5(normalized_address.encode()).hexdigest()}'
+
+
+def _cache_ttl(timestamp):
+    """
+    The older the location is, the less likely it is to change, so it lives
+    in cache for 10% of its age, like HTTP heuristic freshness does.
+    """
+    age = (timezone.now() - timestamp).total_seconds()
+    return min(max(age * 0.1, settings.GEOCODER_CACHE_MIN_TTL), settings.GEOCODER_CACHE_MAX_TTL)
+
+
+class LocationLRU:
+    """Per-process LRU cache like {normalized_address: (expires_at, (lon, lat)), ...}"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, address):
+        with self._lock:
+            item = self._items.get(address)
+            if item is None:
+                return None
+            expires_at, coordinates = item
+            if expires_at < time.time():
+                del self._items[address]
+                return None
+            self._items.move_to_end(address)
+            return coordinates
+
+    def set(self, address, coordinates, expires_at):
+        with self._lock:
+            self._items[address] = (expires_at, coordinates)
+            self._items.move_to_end(address)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def discard(self, address):
+        with self._lock:
+            self._items.pop(address, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+locations_lru = LocationLRU(settings.GEOCODER_LRU_SIZE)
+
+
+def get_locations(addresses):
+    """
+    Read-through cache for Location: per-process LRU -> Django cache -> database,
+    all of them are keyed by normalized address (see geocoder.normalization)
+    return: dict like this: {address: (lon, lat), ...}
+        addresses without location in database are omitted
+    """
+    spellings = defaultdict(list)
+    for address in set(addresses):
+        spellings[normalize_address(address)].append(address)
+
+    found = {}
+    missed = []
+    for normalized_address in spellings:
+        coordinates = locations_lru.get(normalized_address)
+        if coordinates is None:
+            missed.append(normalized_address)
+        else:
+            found[normalized_address] = coordinates
+
+    keys = {_cache_key(normalized_address): normalized_address for normalized_address in missed}
+    if keys:
+        for key, (coordinates, expires_at) in cache.get_many(keys.keys()).items():
+            if expires_at < time.time():
+                continue
+            normalized_address = keys.pop(key)
+            found[normalized_address] = coordinates
+            locations_lru.set(normalized_address, coordinates, expires_at)
+
+    if keys:
+        to_cache = {}
+        geo_query = Location.objects \
+            .filter(normalized_address__in=list(keys.values())) \
+            .values_list('normalized_address', 'lon', 'lat', 'timestamp', 'next_retry')
+        for normalized_address, lon, lat, timestamp, next_retry in geo_query:
+            ttl = _cache_ttl(timestamp)
+            if next_retry is not None:
+                # not found address, keep it until retry unless it is due already
+                ttl = max(min(ttl, (next_retry - timezone.now()).total_seconds()), settings.GEOCODER_CACHE_MIN_TTL)
+            expires_at = time.time() + ttl
+            found[normalized_address] = (lon, lat)
+            locations_lru.set(normalized_address, (lon, lat), expires_at)
+            to_cache[_cache_key(normalized_address)] = ((lon, lat), expires_at)
+        if to_cache:
+            cache.set_many(to_cache, timeout=settings.GEOCODER_CACHE_MAX_TTL)
+
+    return {
+        address: coordinates
+        for normalized_address, coordinates in found.items()
+        for address in spellings[normalized_address]
+    }
+
+
+def invalidate_location(address):
+    normalized_address = normalize_address(address)
+    locations_lru.discard(normalized_address)
+    cache.delete(_cache_key(normalized_address))
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_saved_location(sender, instance, **kwargs):
+    invalidate_location(instance.address)
@@ -0,0 +1,67 @@
+import numpy as np
+from django.conf import settings
+from geopy.distance import EARTH_RADIUS, ELLIPSOIDS
+
+WGS84_MAJOR, _, WGS84_FLATTENING = ELLIPSOIDS['WGS-84']
+
+
+def to_radians(points):
+    """
+    Convert sequence of (lat, lon) to array of radians shaped (N, 2),
+    unknown coordinates like (None, None) become NaN
+    """
+    points = np.array(
+        [(np.nan, np.nan) if lat is None or lon is None else (lat, lon) for lat, lon in points],
+        dtype=float,
+    ).reshape(-1, 2)
+    return np.radians(points)
+
+
+def _central_angle(lat1, lon1, lat2, lon2):
+    """Haversine formula, arguments are broadcasted to result matrix shape"""
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def great_circle_matrix(origins, destinations):
+    lat1, lon1 = origins[:, 0, None], origins[:, 1, None]
+    lat2, lon2 = destinations[None, :, 0], destinations[None, :, 1]
+    return EARTH_RADIUS * _central_angle(lat1, lon1, lat2, lon2)
+
+
+def geodesic_matrix(origins, destinations):
+    """
+    Andoyer-Lambert approximation of geodesic on WGS-84 ellipsoid,
+    error is about ten meters on thousand kilometers.
+    """
+    f = WGS84_FLATTENING
+    beta1 = np.arctan((1 - f) * np.tan(origins[:, 0, None]))
+    beta2 = np.arctan((1 - f) * np.tan(destinations[None, :, 0]))
+    lon1, lon2 = origins[:, 1, None], destinations[None, :, 1]
+    sigma = _central_angle(beta1, lon1, beta2, lon2)
+
+    p = (beta1 + beta2) / 2
+    q = (beta2 - beta1) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+        distances = WGS84_MAJOR * (sigma - f / 2 * (x + y))
+    return np.where(sigma == 0, 0.0, distances)
+
+
+DISTANCE_METHODS = {
+    'great_circle': great_circle_matrix,
+    'geodesic': geodesic_matrix,
+}
+
+
+def distance_matrix(origins, destinations, method=None):
+    """
+    Distances in km between every origin and every destination at once
+    origins, destinations: sequences of (lat, lon)
+    method: 'great_circle' or 'geodesic', settings.GEOCODER_DISTANCE_METHOD by default
+    return: numpy array shaped (len(origins), len(destinations)),
+        NaN for points with unknown coordinates
+    """
+    method = DISTANCE_METHODS[method or settings.GEOCODER_DISTANCE_METHOD]
+    return method(to_radians(origins), to_radians(destinations))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from geocoder.models import process_geocoding_jobs
+
+
+class Command(BaseCommand):
+    help = 'Geocode addresses from the geocoding queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='how many addresses to geocode at once')
+        parser.add_argument('--interval', type=float, default=2,
+                            help='seconds to sleep when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='process the queue until it is drained and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            located, postponed = process_geocoding_jobs(options['batch_size'])
+            if located or postponed:
+                self.stdout.write(f'Geocoded: {located}, postponed: {postponed}')
+            if options['once'] and not located:
+                return
+            if not located:
+                time.sleep(options['interval'])
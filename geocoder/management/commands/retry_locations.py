@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from geocoder.models import retry_not_found_locations
+
+
+class Command(BaseCommand):
+    help = 'Geocode again addresses which were not found, when their retry time has come'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50,
+                            help='how many addresses to geocode at once')
+
+    def handle(self, *args, **options):
+        total_found = 0
+        total_not_found = 0
+        while True:
+            found, not_found = retry_not_found_locations(options['batch_size'])
+            if not found and not not_found:
+                break
+            total_found += found
+            total_not_found += not_found
+        self.stdout.write(f'Found: {total_found}, still not found: {total_not_found}')
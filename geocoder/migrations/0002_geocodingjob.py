@@ -0,0 +1,32 @@
+# Generated by Django 3.2 on 2026-10-18 18:04
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geocoder', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeocodingJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=100, unique=True, verbose_name='Адрес')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Поставлен в очередь')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Попыток геокодирования')),
+            ],
+            options={
+                'verbose_name': 'Адрес в очереди геокодирования',
+                'verbose_name_plural': 'Очередь геокодирования',
+                'ordering': ['attempts', 'created'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='geocodingjob',
+            index=models.Index(fields=['attempts', 'created'], name='geocoder_ge_attempt_9bc498_idx'),
+        ),
+    ]
@@ -0,0 +1,110 @@
+import re
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 1000
+
+# copy of geocoder.normalization, so later changes of it don't change this migration
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'ш': 'шоссе',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'обл': 'область',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'г': '',
+    'гор': '',
+    'город': '',
+    'д': '',
+    'дом': '',
+}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    tokens = TOKEN_PATTERN.findall(address.casefold().replace('ё', 'е'))
+    words = (ABBREVIATIONS.get(token, token) for token in tokens)
+    return ' '.join(word for word in words if word)
+
+
+def is_better(location, other):
+    """Keep found coordinates over not found ones, then the freshest"""
+    return (location.lon is not None, location.timestamp) > (other.lon is not None, other.timestamp)
+
+
+def fill_normalized_addresses(apps, schema_editor):
+    """Every batch is committed separately, duplicates of earlier batches are merged into them"""
+    Location = apps.get_model('geocoder', 'Location')
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(Location.objects.filter(id__gt=last_id).order_by('id')[:BATCH_SIZE])
+            if not batch:
+                return
+            last_id = batch[-1].id
+            for location in batch:
+                location.normalized_address = normalize_address(location.address)
+            keepers = {
+                location.normalized_address: location
+                for location in Location.objects.filter(
+                    normalized_address__in={location.normalized_address for location in batch},
+                )
+            }
+
+            to_delete = []
+            for location in batch:
+                keeper = keepers.get(location.normalized_address)
+                if keeper is None:
+                    keepers[location.normalized_address] = location
+                elif is_better(location, keeper):
+                    keepers[location.normalized_address] = location
+                    to_delete.append(keeper.id)
+                else:
+                    to_delete.append(location.id)
+            Location.objects.filter(id__in=to_delete).delete()
+            to_delete = set(to_delete)
+            Location.objects.bulk_update(
+                [location for location in batch if location.id not in to_delete],
+                ['normalized_address'],
+            )
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('geocoder', '0002_geocodingjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(max_length=200, null=True, verbose_name='Нормализованный адрес'),
+        ),
+        migrations.RunPython(fill_normalized_addresses, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='location',
+            name='normalized_address',
+            field=models.CharField(help_text='см. geocoder.normalization', max_length=200, unique=True,
+                                   verbose_name='Нормализованный адрес'),
+        ),
+        migrations.AlterField(
+            model_name='location',
+            name='address',
+            field=models.CharField(db_index=True, max_length=100, verbose_name='Адрес'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2 on 2026-10-18 18:26
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_not_found_locations(apps, schema_editor):
+    """Locations without coordinates were not found by geocoder, retry them soon"""
+    Location = apps.get_model('geocoder', 'Location')
+    Location.objects \
+        .filter(models.Q(lon__isnull=True) | models.Q(lat__isnull=True)) \
+        .update(state='NOT_FOUND', failures=1, next_retry=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geocoder', '0003_location_normalized_address'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='failures',
+            field=models.PositiveIntegerField(default=0, verbose_name='Неудачных попыток'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='next_retry',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Повторить после'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='state',
+            field=models.CharField(choices=[('FOUND', 'найден'), ('NOT_FOUND', 'не найден')], default='FOUND', max_length=10, verbose_name='Статус'),
+        ),
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['state', 'next_retry'], name='geocoder_lo_state_b53307_idx'),
+        ),
+        migrations.RunPython(mark_not_found_locations, migrations.RunPython.noop),
+    ]
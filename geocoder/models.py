@@ -1,45 +1,255 @@
-import requests
+import logging
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
 from django.conf import settings
 from django.db import models
+from django.db.models import F
+from django.dispatch import Signal
 from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .backends import GeocoderCircuitOpen, GeocoderError, get_geocoder
+from .breaker import geocoder_breaker
+from .normalization import normalize_address
+
+logger = logging.getLogger(__name__)
+
+# sent with argument addresses=[address, ...] when new locations are saved
+locations_added = Signal()
+
+
+def report_request(outcome, duration=None):
+    """Pass outcome and duration of geocoder call to GEOCODER_METRICS_HOOK, when it is set"""
+    if settings.GEOCODER_METRICS_HOOK:
+        import_string(settings.GEOCODER_METRICS_HOOK)(outcome, duration)
+
+
+def fetch_coordinates(address):
+    """
+    Geocode address with backend from GEOCODER_BACKEND setting, see geocoder.backends.
+    Failed requests are retried GEOCODER_RETRIES times after random pause (full jitter),
+    when geocoder keeps failing circuit breaker makes calls fail fast with GeocoderCircuitOpen.
+    """
+    if not geocoder_breaker.allow_request():
+        report_request('circuit_open')
+        raise GeocoderCircuitOpen(address)
+    for attempt in range(settings.GEOCODER_RETRIES + 1):
+        started = time.perf_counter()
+        try:
+            lon, lat = get_geocoder().geocode(address)
+        except GeocoderError:
+            report_request('error', time.perf_counter() - started)
+            geocoder_breaker.record_failure()
+            if attempt == settings.GEOCODER_RETRIES or geocoder_breaker.is_open():
+                raise
+            time.sleep(random.uniform(0, settings.GEOCODER_RETRY_BACKOFF * 2 ** attempt))
+            continue
+        report_request('found' if lon is not None else 'not_found', time.perf_counter() - started)
+        geocoder_breaker.record_success()
+        return lon, lat
 
 
-def fetch_coordinates(address, apikey=settings.YANDEX_KEY):
-    base_url = "https://geocode-maps.yandex.ru/1.x"
-    response = requests.get(base_url, params={
-        "geocode": address,
-        "apikey": apikey,
-        "format": "json",
-    })
-    response.raise_for_status()
-    found_places = response.json()['response']['GeoObjectCollection']['featureMember']
-    if not found_places:
-        return None, None
-    most_relevant = found_places[0]
-    lon, lat = most_relevant['GeoObject']['Point']['pos'].split(" ")
-    return lon, lat
+def geocode_in_pool(addresses):
+    """
+    Geocode addresses in a thread pool. Addresses not geocoded within
+    GEOCODER_BATCH_TIMEOUT seconds or failed with network error are skipped.
+    return: dict like this: {address: (lon, lat), ...}, (None, None) if not found
+    """
+    addresses = set(addresses)
+    if not addresses:
+        return {}
+    executor = ThreadPoolExecutor(max_workers=min(settings.GEOCODER_WORKERS, len(addresses)))
+    futures = {executor.submit(fetch_coordinates, address): address for address in addresses}
+    done, not_done = wait(futures, timeout=settings.GEOCODER_BATCH_TIMEOUT)
+    executor.shutdown(wait=False, cancel_futures=True)
+    if not_done:
+        logger.warning('Geocoding batch timed out, %s addresses postponed', len(not_done))
+
+    geocoded = {}
+    circuit_open_count = 0
+    for future in done:
+        address = futures[future]
+        try:
+            geocoded[address] = future.result()
+        except GeocoderCircuitOpen:
+            circuit_open_count += 1
+        except GeocoderError as error:
+            logger.warning('Geocoding of "%s" failed: %s', address, error)
+    if circuit_open_count:
+        logger.warning('Geocoder circuit breaker is open, %s addresses postponed', circuit_open_count)
+    return geocoded
+
+
+def not_found_retry_delay(failures):
+    """Exponential backoff between geocoding attempts of address which was not found"""
+    delay = settings.GEOCODER_NOT_FOUND_RETRY_DELAY * 2 ** (failures - 1)
+    return timedelta(seconds=min(delay, settings.GEOCODER_NOT_FOUND_MAX_RETRY_DELAY))
 
 
 def add_geocoder_addresses(addresses):
-    new_geo_addresses = {}
-    locations = []
-    for address in addresses:
-        lon, lat = fetch_coordinates(address)
-        locations.append(Location(address=address, lon=lon, lat=lat))
-        new_geo_addresses.update({address: (lon, lat)})
-        Location.objects.bulk_create(locations)
+    """
+    Geocode addresses and save their locations at once, not found addresses are
+    saved too, as NOT_FOUND locations to be retried later (see retry_not_found_locations).
+    Spellings of the same address (see geocoder.normalization) are geocoded once,
+    addresses with already known location are not geocoded at all.
+    Addresses failed to geocode are skipped - they will be requested next time.
+    return: dict like this: {address: (lon, lat), ...}
+    """
+    spellings = defaultdict(list)
+    for address in set(addresses):
+        spellings[normalize_address(address)].append(address)
+    if not spellings:
+        return {}
+    known_locations = Location.objects \
+        .filter(normalized_address__in=spellings.keys()) \
+        .values_list('normalized_address', 'lon', 'lat')
+    located = {normalized_address: (lon, lat) for normalized_address, lon, lat in known_locations}
+
+    to_geocode = [variants[0] for normalized_address, variants in spellings.items()
+                  if normalized_address not in located]
+    now = timezone.now()
+    new_locations = []
+    for address, (lon, lat) in geocode_in_pool(to_geocode).items():
+        location = Location(address=address, normalized_address=normalize_address(address), lon=lon, lat=lat)
+        if lon is None or lat is None:
+            location.state = Location.NOT_FOUND
+            location.failures = 1
+            location.next_retry = now + not_found_retry_delay(1)
+        new_locations.append(location)
+        located[location.normalized_address] = (lon, lat)
+    Location.objects.bulk_create(new_locations, ignore_conflicts=True)
+
+    new_geo_addresses = {
+        address: located[normalized_address]
+        for normalized_address, variants in spellings.items() if normalized_address in located
+        for address in variants
+    }
+    if new_geo_addresses:
+        locations_added.send(sender=Location, addresses=list(new_geo_addresses))
     return new_geo_addresses
 
 
+def retry_not_found_locations(batch_size):
+    """
+    Geocode again next batch of NOT_FOUND locations whose retry time has come,
+    used by retry_locations command. Nothing is done while geocoder circuit breaker is open.
+    return: tuple (count of found addresses, count of still not found addresses)
+    """
+    if geocoder_breaker.is_open():
+        return 0, 0
+    now = timezone.now()
+    locations = list(
+        Location.objects
+        .filter(state=Location.NOT_FOUND, next_retry__lte=now)
+        .order_by('next_retry')[:batch_size]
+    )
+    geocoded = geocode_in_pool(location.address for location in locations)
+
+    found = []
+    not_found_count = 0
+    for location in locations:
+        if location.address not in geocoded:
+            continue
+        lon, lat = geocoded[location.address]
+        if lon is None or lat is None:
+            location.failures += 1
+            location.next_retry = now + not_found_retry_delay(location.failures)
+            not_found_count += 1
+        else:
+            location.lon, location.lat = lon, lat
+            location.state = Location.FOUND
+            location.failures = 0
+            location.next_retry = None
+            location.timestamp = now
+            found.append(location.address)
+        location.save()
+    if found:
+        locations_added.send(sender=Location, addresses=found)
+    return len(found), not_found_count
+
+
+def enqueue_addresses(addresses):
+    """Put addresses without known location into geocoding queue"""
+    addresses = set(addresses)
+    located = set(
+        Location.objects
+        .filter(normalized_address__in={normalize_address(address) for address in addresses})
+        .values_list('normalized_address', flat=True)
+    )
+    GeocodingJob.objects.bulk_create(
+        [GeocodingJob(address=address) for address in addresses if normalize_address(address) not in located],
+        ignore_conflicts=True,
+    )
+
+
+def process_geocoding_jobs(batch_size):
+    """
+    Geocode next batch of queued addresses, used by geocode_worker command.
+    Nothing is done while geocoder circuit breaker is open.
+    return: tuple (count of geocoded addresses, count of postponed addresses)
+    """
+    if geocoder_breaker.is_open():
+        return 0, 0
+    addresses = set(
+        GeocodingJob.objects
+        .order_by('attempts', 'created')
+        .values_list('address', flat=True)[:batch_size]
+    )
+    located = add_geocoder_addresses(addresses)
+    postponed = addresses.difference(located)
+    GeocodingJob.objects.filter(address__in=located).delete()
+    GeocodingJob.objects.filter(address__in=postponed).update(attempts=F('attempts') + 1)
+    return len(located), len(postponed)
+
+
 class Location(models.Model):
-    address = models.CharField('Адрес', max_length=100, unique=True)
+    FOUND = 'FOUND'
+    NOT_FOUND = 'NOT_FOUND'
+    STATES = (
+        (FOUND, 'найден'),
+        (NOT_FOUND, 'не найден'),
+    )
+    address = models.CharField('Адрес', max_length=100, db_index=True)
+    normalized_address = models.CharField('Нормализованный адрес', max_length=200, unique=True,
+                                          help_text='см. geocoder.normalization')
     lon = models.FloatField('Долгота', null=True)
     lat = models.FloatField('Широта', null=True)
     timestamp = models.DateTimeField(default=timezone.now, db_index=True)
+    state = models.CharField('Статус', max_length=10, choices=STATES, default=FOUND)
+    failures = models.PositiveIntegerField('Неудачных попыток', default=0)
+    next_retry = models.DateTimeField('Повторить после', null=True, blank=True)
 
     class Meta:
         verbose_name = 'Локация'
         verbose_name_plural = 'Локации'
+        indexes = [
+            models.Index(fields=['state', 'next_retry']),
+        ]
+
+    def __str__(self):
+        return f'{self.address}'
+
+    def save(self, *args, **kwargs):
+        self.normalized_address = normalize_address(self.address)
+        super().save(*args, **kwargs)
+
+
+class GeocodingJob(models.Model):
+    address = models.CharField('Адрес', max_length=100, unique=True)
+    created = models.DateTimeField('Поставлен в очередь', default=timezone.now)
+    attempts = models.PositiveIntegerField('Попыток геокодирования', default=0)
+
+    class Meta:
+        verbose_name = 'Адрес в очереди геокодирования'
+        verbose_name_plural = 'Очередь геокодирования'
+        ordering = ['attempts', 'created']
+        indexes = [
+            models.Index(fields=['attempts', 'created']),
+        ]
 
     def __str__(self):
         return f'{self.address}'
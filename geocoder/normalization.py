@@ -0,0 +1,42 @@
+import re
+
+# abbreviations of address parts are expanded, words without meaning for geocoder are dropped.
+# Ambiguous ones are kept as is: "пр" is both "проспект" and "проезд"
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'пр-т': 'проспект',
+    'просп': 'проспект',
+    'пр-кт': 'проспект',
+    'пр-д': 'проезд',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'наб': 'набережная',
+    'б-р': 'бульвар',
+    'бул': 'бульвар',
+    'ш': 'шоссе',
+    'туп': 'тупик',
+    'мкр': 'микрорайон',
+    'мкрн': 'микрорайон',
+    'обл': 'область',
+    'к': 'корпус',
+    'корп': 'корпус',
+    'стр': 'строение',
+    'г': '',
+    'гор': '',
+    'город': '',
+    'д': '',
+    'дом': '',
+}
+
+TOKEN_PATTERN = re.compile(r'[\w/]+(?:-[\w/]+)*')
+
+
+def normalize_address(address):
+    """
+    Key to match spellings of the same address: case-folded, without punctuation,
+    with expanded abbreviations and single spaces
+    "г. Москва, ул. Ленина, д.5" -> "москва улица ленина 5"
+    """
+    tokens = TOKEN_PATTERN.findall(address.casefold().replace('ё', 'е'))
+    words = (ABBREVIATIONS.get(token, token) for token in tokens)
+    return ' '.join(word for word in words if word)
@@ -1,3 +1,376 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from geopy import distance
+
+from foodcartapp.models import Order, Product, Restaurant, RestaurantMenuItem
+from .backends import FakeGeocoder, FixtureGeocoder, GeocoderCircuitOpen, GeocoderError, YandexGeocoder
+from .breaker import geocoder_breaker
+from .cache import get_locations, locations_lru
+from .distances import distance_matrix
+from .models import (
+    GeocodingJob, Location, add_geocoder_addresses, enqueue_addresses, fetch_coordinates, retry_not_found_locations,
+)
+from .normalization import normalize_address
+
+KNOWN_ADDRESSES = {
+    'Москва, Красная площадь, 1': ('37.620393', '55.753960'),
+    'Москва, Тверская, 10': ('37.607826', '55.761585'),
+}
+
+# bodies Yandex may send instead of geocoding result
+BROKEN_RESPONSES = {
+    'Неверный ключ': {'statusCode': 403, 'error': 'Forbidden', 'message': 'Invalid api key'},
+    'Пустая точка': {'response': {'GeoObjectCollection': {'featureMember': [{'GeoObject': {'Point': {}}}]}}},
+    'Обрезанный ответ': '{"response": {"GeoObject',
+}
+
+
+reported_requests = []
+
+
+def record_request(outcome, duration):
+    reported_requests.append(outcome)
+
+
+class FakeYandexHandler(BaseHTTPRequestHandler):
+    """Local stand-in for Yandex geocoder HTTP API"""
+    requests_count = 0
+
+    def do_GET(self):
+        FakeYandexHandler.requests_count += 1
+        address = parse_qs(urlparse(self.path).query)['geocode'][0]
+        found_places = []
+        if address in KNOWN_ADDRESSES:
+            found_places.append({'GeoObject': {'Point': {'pos': ' '.join(KNOWN_ADDRESSES[address])}}})
+        body = json.dumps({'response': {'GeoObjectCollection': {'featureMember': found_places}}})
+        if address in BROKEN_RESPONSES:
+            body = BROKEN_RESPONSES[address]
+            body = body if isinstance(body, str) else json.dumps(body)
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FailingGeocoder:
+    calls_count = 0
+
+    def geocode(self, address):
+        FailingGeocoder.calls_count += 1
+        raise GeocoderError('service unavailable')
+
+
+class GeocodingPipelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeYandexHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.settings_override = override_settings(
+            YANDEX_GEOCODER_URL=f'http://127.0.0.1:{cls.server.server_port}/1.x',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FakeYandexHandler.requests_count = 0
+        cache.clear()
+        locations_lru.clear()
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская, 10')
+        self.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=self.product)
+
+    def register_order(self, address):
+        order = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': address,
+            'products': [{'product': self.product.id, 'quantity': 1}],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/order/', order, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_malformed_response_is_geocoder_error(self):
+        geocoder = YandexGeocoder()
+        for address in BROKEN_RESPONSES:
+            with self.subTest(address=address), self.assertRaises(GeocoderError):
+                geocoder.geocode(address)
+        self.assertEqual(geocoder.geocode('Москва, Тверская, 10'), KNOWN_ADDRESSES['Москва, Тверская, 10'])
+
+    def test_order_address_is_queued(self):
+        self.register_order('Москва, Красная площадь, 1')
+        self.assertTrue(GeocodingJob.objects.filter(address='Москва, Красная площадь, 1').exists())
+        self.assertEqual(FakeYandexHandler.requests_count, 0)
+
+    def test_worker_drains_queue(self):
+        self.register_order('Москва, Красная площадь, 1')
+        self.register_order('Неизвестный адрес')
+        call_command('geocode_worker', '--once', stdout=StringIO())
+
+        self.assertFalse(GeocodingJob.objects.exists())
+        location = Location.objects.get(address='Москва, Красная площадь, 1')
+        self.assertAlmostEqual(location.lon, 37.620393)
+        self.assertAlmostEqual(location.lat, 55.753960)
+        not_found = Location.objects.get(address='Неизвестный адрес')
+        self.assertIsNone(not_found.lon)
+        self.assertEqual(not_found.state, Location.NOT_FOUND)
+        self.assertGreater(not_found.next_retry, timezone.now())
+
+    def test_not_found_address_is_retried_on_schedule(self):
+        Location.objects.create(
+            address='Москва, Красная площадь, 1', state=Location.NOT_FOUND, failures=1, next_retry=timezone.now(),
+        )
+        Location.objects.create(
+            address='Неизвестный адрес', state=Location.NOT_FOUND, failures=2, next_retry=timezone.now(),
+        )
+        Location.objects.create(
+            address='Другой адрес', state=Location.NOT_FOUND, failures=1,
+            next_retry=timezone.now() + timedelta(hours=1),
+        )
+
+        self.assertEqual(retry_not_found_locations(batch_size=10), (1, 1))
+        self.assertEqual(FakeYandexHandler.requests_count, 2)
+        found = Location.objects.get(address='Москва, Красная площадь, 1')
+        self.assertEqual((found.state, found.next_retry), (Location.FOUND, None))
+        self.assertAlmostEqual(found.lon, 37.620393)
+        not_found = Location.objects.get(address='Неизвестный адрес')
+        self.assertEqual(not_found.failures, 3)
+        self.assertGreater(not_found.next_retry, timezone.now() + timedelta(hours=3))
+
+    def test_dashboard_does_not_call_geocoder(self):
+        self.register_order('Москва, Красная площадь, 1')
+        manager = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(manager)
+
+        response = self.client.get('/manager/orders/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'координаты уточняются')
+        self.assertEqual(FakeYandexHandler.requests_count, 0)
+        self.assertTrue(GeocodingJob.objects.filter(address='Москва, Тверская, 10').exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('geocode_worker', '--once', stdout=StringIO())
+        response = self.client.get('/manager/orders/')
+        self.assertNotContains(response, 'координаты не определены')
+        self.assertContains(response, 'Star Burger (1,2 км.)')
+        self.assertEqual(Order.objects.count(), 1)
+
+
+class OfflineBackendsTest(TestCase):
+    def test_fixture_backend(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8') as fixture:
+            fixture.write('address,lon,lat\n"Москва, Тверская, 10",37.607826,55.761585\n')
+            fixture.flush()
+            geocoder = FixtureGeocoder(fixture.name)
+        self.assertEqual(geocoder.geocode('Москва, Тверская, 10'), ('37.607826', '55.761585'))
+        self.assertEqual(geocoder.geocode('Неизвестный адрес'), (None, None))
+
+    @override_settings(GEOCODER_BACKEND='geocoder.backends.FakeGeocoder')
+    def test_worker_with_fake_backend(self):
+        GeocodingJob.objects.create(address='Москва, Тверская, 10')
+        call_command('geocode_worker', '--once', stdout=StringIO())
+
+        self.assertFalse(GeocodingJob.objects.exists())
+        location = Location.objects.get(address='Москва, Тверская, 10')
+        self.assertEqual((location.lon, location.lat), FakeGeocoder().geocode('Москва, Тверская, 10'))
+
+
+@override_settings(
+    GEOCODER_BACKEND='geocoder.tests.FailingGeocoder',
+    GEOCODER_RETRIES=1,
+    GEOCODER_RETRY_BACKOFF=0,
+    GEOCODER_BREAKER_THRESHOLD=4,
+)
+class CircuitBreakerTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        FailingGeocoder.calls_count = 0
+
+    def test_breaker_opens_after_failures(self):
+        for _ in range(2):
+            with self.assertRaises(GeocoderError):
+                fetch_coordinates('Москва, Тверская, 10')
+        self.assertEqual(FailingGeocoder.calls_count, 4)
+        self.assertTrue(geocoder_breaker.is_open())
+
+        with self.assertRaises(GeocoderCircuitOpen):
+            fetch_coordinates('Москва, Тверская, 10')
+        self.assertEqual(FailingGeocoder.calls_count, 4)
+
+    @override_settings(GEOCODER_METRICS_HOOK='geocoder.tests.record_request')
+    def test_requests_are_reported_to_hook(self):
+        reported_requests.clear()
+        for _ in range(3):
+            with self.assertRaises(GeocoderError):
+                fetch_coordinates('Москва, Тверская, 10')
+        self.assertEqual(reported_requests, ['error'] * 4 + ['circuit_open'])
+
+    def test_dashboard_shows_unavailable_coordinates(self):
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва, Тверская, 10')
+        product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=product)
+        order = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Красная площадь, 1',
+            'products': [{'product': product.id, 'quantity': 1}],
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/order/', order, content_type='application/json')
+        for _ in range(2):
+            with self.assertRaises(GeocoderError):
+                fetch_coordinates('Москва, Красная площадь, 1')
+
+        call_command('geocode_worker', '--once', stdout=StringIO())
+        self.assertEqual(FailingGeocoder.calls_count, 4)
+        self.assertEqual(GeocodingJob.objects.get(address='Москва, Красная площадь, 1').attempts, 0)
+
+        manager = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(manager)
+        response = self.client.get('/manager/orders/')
+        self.assertContains(response, 'координаты недоступны')
+
+
+class LocationCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        locations_lru.clear()
+        Location.objects.create(address='Москва, Тверская, 10', lon=37.607826, lat=55.761585)
+
+    def test_repeated_reads_skip_database(self):
+        with self.assertNumQueries(1):
+            get_locations(['Москва, Тверская, 10', 'Неизвестный адрес'])
+        with self.assertNumQueries(1):
+            get_locations(['Москва, Тверская, 10', 'Неизвестный адрес'])
+        with self.assertNumQueries(0):
+            locations = get_locations(['Москва, Тверская, 10'])
+        self.assertEqual(locations, {'Москва, Тверская, 10': (37.607826, 55.761585)})
+
+    def test_shared_cache_survives_process_cache_loss(self):
+        get_locations(['Москва, Тверская, 10'])
+        locations_lru.clear()
+        with self.assertNumQueries(0):
+            get_locations(['Москва, Тверская, 10'])
+
+    def test_saved_location_is_invalidated(self):
+        get_locations(['Москва, Тверская, 10'])
+        location = Location.objects.get(address='Москва, Тверская, 10')
+        location.lon = 37.6
+        location.save()
+        self.assertEqual(get_locations(['Москва, Тверская, 10']), {'Москва, Тверская, 10': (37.6, 55.761585)})
+
+
+class AddressNormalizationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        locations_lru.clear()
+
+    def test_spellings_have_same_key(self):
+        self.assertEqual(normalize_address('ул. Ленина 5'), 'улица ленина 5')
+        self.assertEqual(normalize_address('улица Ленина, 5 '), 'улица ленина 5')
+        self.assertEqual(normalize_address('г. Москва, Тверская ул., д.10'), 'москва тверская улица 10')
+        self.assertEqual(normalize_address('пр-т Мира 5'), 'проспект мира 5')
+        self.assertEqual(normalize_address('пр Мира 5'), 'пр мира 5')
+
+    def test_lookups_use_normalized_address(self):
+        Location.objects.create(address='ул. Ленина 5', lon=37.6, lat=55.7)
+        self.assertEqual(get_locations(['улица Ленина, 5']), {'улица Ленина, 5': (37.6, 55.7)})
+
+        enqueue_addresses(['Улица Ленина 5', 'Ленина проспект 5'])
+        self.assertEqual(list(GeocodingJob.objects.values_list('address', flat=True)), ['Ленина проспект 5'])
+
+    @override_settings(GEOCODER_BACKEND='geocoder.backends.FakeGeocoder')
+    def test_spellings_are_geocoded_once(self):
+        located = add_geocoder_addresses(['ул. Ленина 5', 'улица Ленина, 5'])
+        self.assertEqual(set(located), {'ул. Ленина 5', 'улица Ленина, 5'})
+        self.assertEqual(Location.objects.count(), 1)
+
+
+class NormalizedAddressMigrationTest(TransactionTestCase):
+    def migrate(self, target):
+        executor = MigrationExecutor(connection)
+        executor.migrate([('geocoder', target)])
+        return executor.loader.project_state([('geocoder', target)]).apps.get_model('geocoder', 'Location')
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_duplicates_are_merged(self):
+        Location = self.migrate('0002_geocodingjob')
+        now = timezone.now()
+        found = Location.objects.create(address='ул. Ленина 5', lon=37.6, lat=55.7, timestamp=now - timedelta(days=1))
+        Location.objects.create(address='улица Ленина, 5', timestamp=now)
+        Location.objects.create(address='Тверская 10', lon=37.5, lat=55.8, timestamp=now - timedelta(days=1))
+        fresh = Location.objects.create(address='Тверская, 10', lon=37.6, lat=55.7, timestamp=now)
+        Location.objects.create(address='пр Мира 5', lon=37.1, lat=55.1)
+        Location.objects.create(address='проспект Мира 5', lon=37.2, lat=55.2)
+
+        Location = self.migrate('0003_location_normalized_address')
+        self.assertEqual(
+            dict(Location.objects.values_list('normalized_address', 'address')),
+            {'улица ленина 5': 'ул. Ленина 5', 'тверская 10': 'Тверская, 10', 'пр мира 5': 'пр Мира 5',
+             'проспект мира 5': 'проспект Мира 5'},
+        )
+        self.assertEqual(Location.objects.get(address='ул. Ленина 5').id, found.id)
+        self.assertEqual(Location.objects.get(address='Тверская, 10').id, fresh.id)
+
+
+class DistanceMatrixTest(SimpleTestCase):
+    points = [
+        (55.753960, 37.620393),
+        (55.761585, 37.607826),
+        (59.939095, 30.315868),
+        (43.585472, 39.723098),
+        (-33.868820, 151.209290),
+        (0, 0),
+    ]
+
+    def test_great_circle_matches_geopy(self):
+        distances = distance_matrix(self.points, self.points, method='great_circle')
+        for row, origin in enumerate(self.points):
+            for column, destination in enumerate(self.points):
+                expected = distance.great_circle(origin, destination).km
+                self.assertAlmostEqual(distances[row, column], expected, delta=1e-6)
+
+    def test_geodesic_approximation_matches_geopy(self):
+        distances = distance_matrix(self.points, self.points, method='geodesic')
+        for row, origin in enumerate(self.points):
+            for column, destination in enumerate(self.points):
+                expected = distance.geodesic(origin, destination).km
+                self.assertAlmostEqual(distances[row, column], expected, delta=max(0.005, expected * 1e-5))
+
+    def test_unknown_coordinates(self):
+        distances = distance_matrix([(None, None), (55.753960, 37.620393)], [(55.761585, 37.607826)])
+        self.assertEqual(distances.shape, (2, 1))
+        self.assertTrue(np.isnan(distances[0, 0]))
+        self.assertFalse(np.isnan(distances[1, 0]))
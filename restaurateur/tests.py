@@ -1,3 +1,177 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from foodcartapp.candidates import refresh_candidates
+from foodcartapp.models import Order, OrderedProduct, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from geocoder.cache import locations_lru
+from geocoder.models import Location
+from .views import build_products_matrix
+
+
+def create_order(**fields):
+    return Order.objects.create(firstname='Иван', lastname='Петров', phonenumber='+79161234567', **fields)
+
+
+class ManagerTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        manager = User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.force_login(manager)
+
+
+class OrderChangesTest(ManagerTestCase):
+    def read_events(self, response):
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = response.content.decode().strip().split('\n\n')
+        data = [json.loads(event[len('data: '):]) for event in events if event.startswith('data: ')]
+        last_event_id, = [event[len('id: '):] for event in events if event.startswith('id: ')]
+        return data, last_event_id
+
+    def test_changes_are_sent_once(self):
+        response = self.client.get('/manager/orders/')
+        cursor = response.context['changes_cursor']
+        with self.captureOnCommitCallbacks(execute=True):
+            order = create_order(address='Москва, Тверская, 10')
+
+        changes, last_event_id = self.read_events(self.client.get('/manager/orders/changes/', {'cursor': cursor}))
+        self.assertEqual([change['id'] for change in changes], [order.id])
+        self.assertIn(f'id="order-{order.id}"', changes[0]['html'])
+
+        # EventSource reconnects with the original URL and the last event id in header
+        changes, _ = self.read_events(self.client.get(
+            '/manager/orders/changes/', {'cursor': cursor}, HTTP_LAST_EVENT_ID=last_event_id,
+        ))
+        self.assertEqual(changes, [])
+
+    def test_finished_order_is_removed_from_board(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = create_order(address='Москва, Тверская, 10')
+        cursor = self.client.get('/manager/orders/').context['changes_cursor']
+        order.status = 'FINISH'
+        with self.captureOnCommitCallbacks(execute=True):
+            order.save()
+
+        response = self.client.get('/manager/orders/changes/', {'cursor': cursor, 'mode': 'short-poll'})
+        changes = response.json()['changes']
+        self.assertEqual([(change['id'], change['html']) for change in changes], [(order.id, None)])
+        self.assertNotEqual(response.json()['cursor'], cursor)
+
+    def test_malformed_cursor_starts_from_now(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            create_order(address='Москва, Тверская, 10')
+        changes, last_event_id = self.read_events(self.client.get('/manager/orders/changes/', {'cursor': 'abc'}))
+        self.assertEqual(changes, [])
+        self.assertRegex(last_event_id, r'^\d+:\d+$')
+
+
+class OrderGeocodingStateTest(ManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        locations_lru.clear()
+        burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        restaurant = Restaurant.objects.create(name='Star Burger', address='Москва', lat=55.75, lon=37.62)
+        RestaurantMenuItem.objects.create(restaurant=restaurant, product=burger)
+        self.order = create_order(address='Москва, Тверская, 10')
+        OrderedProduct.objects.create(order=self.order, product=burger, cost=burger.price)
+        refresh_candidates([self.order.id])
+
+    def test_address_in_geocoding_queue(self):
+        response = self.client.get('/manager/orders/')
+        self.assertContains(response, 'координаты уточняются')
+        self.assertNotContains(response, 'координаты не определены')
+
+    def test_address_not_found(self):
+        Location.objects.create(address='г. Москва, Тверская, д. 10', state=Location.NOT_FOUND)
+        response = self.client.get('/manager/orders/')
+        self.assertContains(response, 'координаты не определены')
+        self.assertNotContains(response, 'координаты уточняются')
+
+
+@override_settings(MANAGER_ORDERS_PAGE_SIZE=2)
+class OrdersBoardPaginationTest(ManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        statuses = ['WORK', 'START', 'FINISH', 'START', 'WORK', 'START']
+        self.orders = [create_order(address='Москва, Тверская, 10', status=status) for status in statuses]
+
+    def board_ids(self, response):
+        return [order['id'] for order in response.context['orders']]
+
+    def test_pages_follow_status_and_id(self):
+        pages = []
+        params = {}
+        while True:
+            response = self.client.get('/manager/orders/', params)
+            pages.append(self.board_ids(response))
+            if not response.context['next_cursor']:
+                break
+            params = {'after': response.context['next_cursor']}
+        starts = [order.id for order in self.orders if order.status == 'START']
+        works = [order.id for order in self.orders if order.status == 'WORK']
+        self.assertEqual(pages, [starts[:2], [starts[2], works[0]], [works[1]]])
+        self.assertEqual(response.context['total_count'], 5)
+
+    def test_last_full_page_has_no_next(self):
+        response = self.client.get('/manager/orders/', {'status': 'WORK'})
+        self.assertEqual(len(self.board_ids(response)), 2)
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertEqual(
+            [(status, count) for status, _, count in response.context['status_filters']],
+            [('START', 3), ('WORK', 2)],
+        )
+
+    def test_malformed_cursor_shows_first_page(self):
+        first_page = self.board_ids(self.client.get('/manager/orders/'))
+        for after in ['FINISH:1', 'START:abc', 'START']:
+            response = self.client.get('/manager/orders/', {'after': after})
+            self.assertEqual(self.board_ids(response), first_page)
+            self.assertEqual(response.context['after'], '')
+
+
+class ProductsMatrixTest(ManagerTestCase):
+    def setUp(self):
+        super().setUp()
+        self.drinks = ProductCategory.objects.create(name='Напитки')
+        self.restaurants = [
+            Restaurant.objects.create(name=name, address=name) for name in ['Арбат', 'Тверская']
+        ]
+        self.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        self.cola = Product.objects.create(name='Кола', price=50, image='cola.jpg', category=self.drinks)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.menu_item = RestaurantMenuItem.objects.create(restaurant=self.restaurants[0], product=self.burger)
+            RestaurantMenuItem.objects.create(restaurant=self.restaurants[1], product=self.cola, availability=False)
+
+    def test_matrix(self):
+        restaurants, products = build_products_matrix()
+        self.assertEqual(restaurants, [(restaurant.id, restaurant.name) for restaurant in self.restaurants])
+        self.assertEqual(
+            [(product['name'], product['availability']) for product in products],
+            [('Бургер', [True, False]), ('Кола', [False, False])],
+        )
+        _, products = build_products_matrix(self.drinks.id)
+        self.assertEqual([product['name'] for product in products], ['Кола'])
+
+    def test_table_is_cached_until_menu_or_restaurants_change(self):
+        with mock.patch('restaurateur.views.build_products_matrix', wraps=build_products_matrix) as build:
+            self.client.get('/manager/products/')
+            self.client.get('/manager/products/')
+            self.assertEqual(build.call_count, 1)
+            self.client.get('/manager/products/', {'category': self.drinks.id})
+            self.assertEqual(build.call_count, 2)
+
+            self.menu_item.availability = False
+            with self.captureOnCommitCallbacks(execute=True):
+                self.menu_item.save()
+            self.client.get('/manager/products/')
+            self.assertEqual(build.call_count, 3)
+
+            self.restaurants[1].name = 'Тверская 2'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.restaurants[1].save()
+            response = self.client.get('/manager/products/')
+            self.assertEqual(build.call_count, 4)
+        self.assertIn('Тверская 2', response.content.decode())
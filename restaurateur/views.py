@@ -1,15 +1,30 @@
+import json
 from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
 
 from django import forms
+from django.conf import settings
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 from django.contrib.auth.decorators import user_passes_test
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db.models import Count, Q, Sum
+from django.http import HttpResponse, JsonResponse
 from django.shortcuts import redirect, render
-from django.urls import reverse_lazy
+from django.template.loader import render_to_string
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.views import View
 from geopy import distance
 
-from foodcartapp.models import Product, Restaurant, Order, RestaurantMenuItem
+from analytics.models import ProductSales, RestaurantSales, RollupWatermark
+from analytics.rollups import WATERMARK_NAME as SALES_WATERMARK_NAME
+from foodcartapp.models import (
+    Product, ProductCategory, Restaurant, Order, OrderCandidate, RestaurantMenuItem, Resraurant_location,
+)
+from foodcartapp.versions import get_version
+from geocoder.breaker import geocoder_breaker
 from geocoder.models import Location, add_geocoder_addresses
 
 
@@ -61,31 +76,67 @@ class LogoutView(auth_views.LogoutView):
     next_page = reverse_lazy('restaurateur:login')
 
 
+ORDERS_BOARD_STATUSES = ('START', 'WORK')
+
+
 def is_manager(user):
     return user.is_staff  # FIXME replace with specific permission
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
-
-    default_availability = {restaurant.id: False for restaurant in restaurants}
-    products_with_restaurants = []
-    for product in products:
-        availability = {
-            **default_availability,
-            **{item.restaurant_id: item.availability for item in product.menu_items.all()},
+def build_products_matrix(category_id=None):
+    """
+    Availability matrix of products in restaurants, by single pass over menu items
+    return: tuple (restaurants, products) where restaurants is list of (id, name)
+        and products is list of dicts with 'availability' - list of bool in restaurants order
+    """
+    restaurants = list(Restaurant.objects.order_by('name').values_list('id', 'name'))
+    columns = {restaurant: column for column, (restaurant, _) in enumerate(restaurants)}
+    products_query = Product.objects.order_by('id')
+    menu_items = RestaurantMenuItem.objects.all()
+    if category_id is not None:
+        products_query = products_query.filter(category_id=category_id)
+        menu_items = menu_items.filter(product__category_id=category_id)
+
+    products = {}
+    for product_id, name, category, price, image in products_query \
+            .values_list('id', 'name', 'category__name', 'price', 'image'):
+        products[product_id] = {
+            'id': product_id,
+            'name': name,
+            'category': category,
+            'price': price,
+            'image_url': default_storage.url(image) if image else '',
+            'availability': [False] * len(restaurants),
         }
-        orderer_availability = [availability[restaurant.id] for restaurant in restaurants]
+    for product_id, restaurant_id, availability in menu_items \
+            .values_list('product_id', 'restaurant_id', 'availability'):
+        if product_id in products:
+            products[product_id]['availability'][columns[restaurant_id]] = availability
+    return restaurants, list(products.values())
 
-        products_with_restaurants.append(
-            (product, orderer_availability)
-        )
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_products(request):
+    category_id = request.GET.get('category')
+    category_id = int(category_id) if category_id and category_id.isdigit() else None
+    cache_key = 'restaurateur:products:{}:{}:{}'.format(
+        get_version('catalog'),
+        get_version('restaurants'),
+        category_id,
+    )
+    products_table = cache.get(cache_key)
+    if products_table is None:
+        restaurants, products = build_products_matrix(category_id)
+        products_table = render_to_string('products_table.html', context={
+            'products': products,
+            'restaurants': restaurants,
+            'categories': ProductCategory.objects.order_by('name').values_list('id', 'name'),
+            'category_id': category_id,
+        })
+        cache.set(cache_key, products_table, timeout=settings.CATALOG_CACHE_TIMEOUT)
 
     return render(request, template_name="products_list.html", context={
-        'products_with_restaurants': products_with_restaurants,
-        'restaurants': restaurants,
+        'products_table': products_table,
     })
 
 
@@ -96,16 +147,209 @@ def view_restaurants(request):
     })
 
 
+class SalesPeriod(forms.Form):
+    date_from = forms.DateField(label='С', required=False, widget=forms.DateInput(attrs={
+        'class': 'form-control', 'type': 'date',
+    }))
+    date_to = forms.DateField(label='по', required=False, widget=forms.DateInput(attrs={
+        'class': 'form-control', 'type': 'date',
+    }))
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def view_sales(request):
+    """Sales report, reads only rollups of analytics app (manage.py rollup_sales)"""
+    today = timezone.localdate()
+    form = SalesPeriod(request.GET)
+    period = form.cleaned_data if form.is_valid() else {}
+    date_from = period.get('date_from') or today - timedelta(days=30)
+    date_to = period.get('date_to') or today
+
+    restaurant_sales = RestaurantSales.objects.filter(day__range=(date_from, date_to))
+    sold = restaurant_sales.exclude(status='CANCEL')
+    by_restaurant = sold \
+        .values('restaurant__name') \
+        .annotate(orders_count=Sum('orders_count'), revenue=Sum('revenue')) \
+        .order_by('-revenue')
+    by_day = sold \
+        .values('day') \
+        .annotate(orders_count=Sum('orders_count'), revenue=Sum('revenue')) \
+        .order_by('day')
+    by_status = dict(
+        restaurant_sales
+            .values_list('status')
+            .annotate(Sum('orders_count'))
+            .order_by()
+    )
+    top_products = ProductSales.objects \
+        .filter(day__range=(date_from, date_to)) \
+        .values('product__name') \
+        .annotate(quantity=Sum('quantity'), revenue=Sum('revenue')) \
+        .order_by('-revenue')[:20]
+    watermark = RollupWatermark.objects.filter(name=SALES_WATERMARK_NAME).first()
+
+    return render(request, template_name='sales_report.html', context={
+        'form': SalesPeriod(initial={'date_from': date_from, 'date_to': date_to}),
+        'date_from': date_from,
+        'date_to': date_to,
+        'by_restaurant': by_restaurant,
+        'by_day': by_day,
+        'by_status': [(title, by_status.get(status, 0)) for status, title in Order.STATUSES],
+        'top_products': top_products,
+        'rolled_up_at': watermark.value if watermark else None,
+    })
+
+
+def parse_orders_cursor(cursor):
+    """Cursor of orders board page looks like 'START:123' - status and id of last order on previous page"""
+    status, _, order_id = cursor.partition(':')
+    if status not in ORDERS_BOARD_STATUSES or not order_id.isdigit():
+        return None
+    return status, int(order_id)
+
+
+def fetch_board_orders(orders_query):
+    """Orders for manager board with nearest restaurants which can cook them"""
+    orders = list(orders_query.values(
+        'id', 'status', 'phonenumber', 'address', 'comment', 'restaurant__name', 'updated', 'normalized_address',
+    ))
+    can_cook = defaultdict(list)
+    candidates = OrderCandidate.objects \
+        .filter(order_id__in=[order['id'] for order in orders if order['status'] == 'START'],
+                rank__lt=settings.MANAGER_CANDIDATES_LIMIT) \
+        .order_by('order_id', 'rank') \
+        .values_list('order_id', 'restaurant__name', 'distance')
+    if settings.MANAGER_CANDIDATES_RADIUS is not None:
+        candidates = candidates.filter(Q(distance__lte=settings.MANAGER_CANDIDATES_RADIUS) | Q(distance__isnull=True))
+    for order_id, restaurant_name, distance in candidates:
+        can_cook[order_id].append(Resraurant_location(restaurant_name, distance))
+    # address without Location is still in geocoding queue
+    located = set(Location.objects
+                  .filter(normalized_address__in=[order['normalized_address'] for order in orders
+                                                  if can_cook[order['id']]])
+                  .values_list('normalized_address', flat=True))
+    for order in orders:
+        order.update({
+            'cancook': can_cook[order['id']],
+            'revision': to_timestamp(order['updated']),
+            'geocoding': order['normalized_address'] not in located,
+        })
+    return orders
+
+
+def to_timestamp(moment):
+    return int(moment.timestamp() * 1_000_000)
+
+
+def make_changes_cursor(moment, version):
+    """Cursor of order changes looks like '1650000000000000:42' - time of check in microseconds and 'orders' version"""
+    return f'{to_timestamp(moment)}:{version}'
+
+
+def parse_changes_cursor(cursor):
+    """return: tuple (moment, version) or (None, None) if cursor is malformed"""
+    timestamp, _, version = (cursor or '').partition(':')
+    try:
+        return datetime.fromtimestamp(int(timestamp) / 1_000_000, tz=dt_timezone.utc), int(version)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None, None
+
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
 def view_orders(request):
     # i=request.GET['111'] #test rollbar
-    fields = ('id', 'status', 'phonenumber', 'address', 'comment', 'restaurant__name')
-    can_cook = Order.objects.filter(status='START').can_cook_with_distance()
-    orders = list(Order.objects.filter(status__in=("START", "WORK")) \
-                  .select_related('restaurant', 'products') \
-                  .order_by('status', 'id') \
-                  .values(*fields))
-    for order in orders:
-        order.update({'cancook': can_cook[order['id']] if order['id'] in can_cook else []})
-    return render(request, template_name='order_items.html', context={'orders': orders})
+    changes_cursor = make_changes_cursor(timezone.now(), get_version('orders'))
+    status = request.GET.get('status')
+    statuses = [status] if status in ORDERS_BOARD_STATUSES else ORDERS_BOARD_STATUSES
+    orders_query = Order.objects.filter(status__in=statuses)
+    after = request.GET.get('after', '')
+    cursor = parse_orders_cursor(after)
+    if cursor:
+        last_status, last_id = cursor
+        orders_query = orders_query.filter(Q(status__gt=last_status) | Q(status=last_status, id__gt=last_id))
+    page_size = settings.MANAGER_ORDERS_PAGE_SIZE
+    orders = fetch_board_orders(orders_query.order_by('status', 'id')[:page_size + 1])
+    next_cursor = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        next_cursor = f"{orders[-1]['status']}:{orders[-1]['id']}"
+
+    statuses_count = dict(
+        Order.objects
+        .filter(status__in=ORDERS_BOARD_STATUSES)
+        .values_list('status')
+        .annotate(Count('id'))
+        .order_by()
+    )
+    status_filters = [
+        (board_status, title, statuses_count.get(board_status, 0))
+        for board_status, title in Order.STATUSES if board_status in ORDERS_BOARD_STATUSES
+    ]
+    return render(request, template_name='order_items.html', context={
+        'orders': orders,
+        'status': status if status in ORDERS_BOARD_STATUSES else None,
+        'status_filters': status_filters,
+        'total_count': sum(statuses_count.values()),
+        'after': after if cursor else '',
+        'next_cursor': next_cursor,
+        'changes_cursor': changes_cursor,
+        'changes_interval': int(settings.ORDERS_CHANGES_POLL_INTERVAL * 1000),
+        'geocoder_unavailable': geocoder_breaker.is_open(),
+    })
+
+
+def find_order_changes(request, cursor):
+    """
+    Orders changed since cursor, see make_changes_cursor. Database is queried only
+    when shared 'orders' version has changed. Orders changed a little before the
+    cursor are reported again, as transactions may commit in other order than they
+    started, rows carry 'revision' so the board skips ones it already shows.
+    return: tuple (list of changes, new cursor)
+    """
+    moment, version = parse_changes_cursor(cursor)
+    now = timezone.now()
+    current_version = get_version('orders')
+    new_cursor = make_changes_cursor(now, current_version)
+    if moment is None or version == current_version:
+        return [], new_cursor
+
+    since = moment - timedelta(seconds=settings.ORDERS_CHANGES_OVERLAP)
+    geocoder_unavailable = geocoder_breaker.is_open()
+    changes = [
+        {
+            'id': order['id'],
+            'status': order['status'],
+            'revision': order['revision'],
+            'html': render_to_string('order_row.html', {
+                'order': order,
+                'board_path': reverse('restaurateur:view_orders'),
+                'geocoder_unavailable': geocoder_unavailable,
+            }, request=request)
+            if order['status'] in ORDERS_BOARD_STATUSES else None,
+        }
+        for order in fetch_board_orders(Order.objects.filter(updated__gt=since).order_by('id'))
+    ]
+    return changes, new_cursor
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def stream_order_changes(request):
+    """
+    Changed rows of orders board as server-sent events, ?mode=short-poll returns them as JSON.
+    Both are short polling: request is answered after one check and doesn't hold web server
+    worker. EventSource reconnects in ORDERS_CHANGES_POLL_INTERVAL seconds with the last
+    cursor in Last-Event-ID header, JSON client asks again in the same interval.
+    """
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('cursor')
+    changes, new_cursor = find_order_changes(request, cursor)
+
+    if request.GET.get('mode') == 'short-poll':
+        return JsonResponse({'cursor': new_cursor, 'changes': changes})
+
+    events = [f'retry: {int(settings.ORDERS_CHANGES_POLL_INTERVAL * 1000)}\n\n']
+    events.extend(f'data: {json.dumps(change, ensure_ascii=False)}\n\n' for change in changes)
+    # event without data only moves Last-Event-ID of the client
+    events.append(f'id: {new_cursor}\n\n')
+    response = HttpResponse(''.join(events), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    return response
@@ -0,0 +1,226 @@
+"""
+Request and geocoder metrics in Prometheus text format.
+
+Every process accumulates metrics in memory and dumps its totals to own file
+in METRICS_DIR at most every METRICS_FLUSH_INTERVAL seconds. /metrics sums
+files of all processes, like multiprocess mode of prometheus_client does.
+Files of finished processes are removed, Prometheus sees it as counters reset.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DESCRIPTIONS = {
+    'http_requests_total': ('counter', 'Requests by view, method and response status'),
+    'http_request_duration_seconds': ('histogram', 'Request latency by view'),
+    'http_request_db_queries_total': ('counter', 'Database queries made by view'),
+    'http_request_db_seconds_total': ('counter', 'Time spent in database queries by view'),
+    'geocoder_requests_total': ('counter', 'Geocoder API calls by outcome'),
+    'geocoder_request_duration_seconds': ('histogram', 'Geocoder API call latency'),
+}
+
+
+class MetricsRegistry:
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._reset()
+        if hasattr(os, 'register_at_fork'):
+            # forked workers (gunicorn --preload) start with empty metrics and own file
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._flushed_at = time.monotonic()
+
+    @property
+    def path(self):
+        return os.path.join(self.directory, f'{os.getpid()}.json')
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[name, tuple(sorted(labels.items()))] += value
+
+    def observe(self, name, labels, value):
+        """Add value to histogram with LATENCY_BUCKETS, counts are stored per bucket, not cumulative"""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.setdefault(key, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0, 'count': 0})
+            for index, upper_bound in enumerate(LATENCY_BUCKETS):
+                if value <= upper_bound:
+                    histogram['buckets'][index] += 1
+                    break
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._flushed_at = time.monotonic()
+            if not self._counters and not self._histograms:
+                return
+            dump = {
+                'counters': [[name, labels, value] for (name, labels), value in self._counters.items()],
+                'histograms': [[name, labels, histogram] for (name, labels), histogram in self._histograms.items()],
+            }
+        os.makedirs(self.directory, exist_ok=True)
+        temporary_path = f'{self.path}.tmp'
+        with open(temporary_path, 'w') as dump_file:
+            json.dump(dump, dump_file)
+        os.replace(temporary_path, self.path)
+
+    def collect(self):
+        """Sum metrics from files of all processes, files of finished processes are removed"""
+        counters = defaultdict(float)
+        histograms = {}
+        for filename in os.listdir(self.directory) if os.path.isdir(self.directory) else []:
+            pid, extension = os.path.splitext(filename)
+            if extension != '.json' or not pid.isdigit():
+                continue
+            if not is_process_alive(int(pid)):
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(os.path.join(self.directory, filename)) as dump_file:
+                    dump = json.load(dump_file)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in dump['counters']:
+                counters[name, tuple(map(tuple, labels))] += value
+            for name, labels, histogram in dump['histograms']:
+                total = histograms.setdefault(
+                    (name, tuple(map(tuple, labels))),
+                    {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0, 'count': 0},
+                )
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], histogram['buckets'])]
+                total['sum'] += histogram['sum']
+                total['count'] += histogram['count']
+        return counters, histograms
+
+
+def is_process_alive(pid):
+    if os.name != 'posix':
+        # signal 0 only checks the process on POSIX, on Windows os.kill terminates it
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # process of another user
+        pass
+    return True
+
+
+def format_series(name, labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{label}="{escape(value)}"' for label, value in labels) + '}'
+
+
+def render_prometheus(counters, histograms):
+    lines = []
+    for metric_name, (metric_type, description) in DESCRIPTIONS.items():
+        lines.append(f'# HELP {metric_name} {description}')
+        lines.append(f'# TYPE {metric_name} {metric_type}')
+        if metric_type == 'counter':
+            for (name, labels), value in sorted(counters.items()):
+                if name == metric_name:
+                    lines.append(f'{format_series(name, labels)} {value:g}')
+            continue
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name != metric_name:
+                continue
+            cumulative = 0
+            for upper_bound, bucket_count in zip(LATENCY_BUCKETS, histogram['buckets']):
+                cumulative += bucket_count
+                lines.append(f'{format_series(name + "_bucket", labels + (("le", f"{upper_bound:g}"),))} {cumulative}')
+            lines.append(f'{format_series(name + "_bucket", labels + (("le", "+Inf"),))} {histogram["count"]}')
+            lines.append(f'{format_series(name + "_sum", labels)} {histogram["sum"]:g}')
+            lines.append(f'{format_series(name + "_count", labels)} {histogram["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL)
+
+
+def record_geocoder_request(outcome, duration):
+    """GEOCODER_METRICS_HOOK, see geocoder.models.fetch_coordinates"""
+    registry.inc('geocoder_requests_total', {'outcome': outcome})
+    if duration is not None:
+        registry.observe('geocoder_request_duration_seconds', {}, duration)
+    registry.maybe_flush()
+
+
+class QueriesCounter:
+    """Database execute wrapper, counts queries and time spent in them"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueriesCounter()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        if match is None:
+            view = 'unresolved'
+        else:
+            view = match.view_name if match.url_name else match.route
+        registry.inc('http_requests_total', {'view': view, 'method': request.method, 'status': response.status_code})
+        registry.observe('http_request_duration_seconds', {'view': view}, duration)
+        registry.inc('http_request_db_queries_total', {'view': view}, queries.count)
+        registry.inc('http_request_db_seconds_total', {'view': view}, queries.duration)
+        registry.maybe_flush()
+        return response
+
+
+def metrics_view(request):
+    """Staff-only, Prometheus may pass METRICS_TOKEN in Authorization: Bearer header instead"""
+    token = settings.METRICS_TOKEN
+    authorized_by_token = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not authorized_by_token and not request.user.is_staff:
+        return HttpResponseForbidden()
+    registry.flush()
+    return HttpResponse(
+        render_prometheus(*registry.collect()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 
 import dj_database_url
 import rollbar
@@ -15,7 +16,39 @@ SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', False)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
-YANDEX_KEY = env('YANDEX_KEY')
+YANDEX_KEY = env('YANDEX_KEY', '')
+GEOCODER_BACKEND = env('GEOCODER_BACKEND', 'geocoder.backends.YandexGeocoder')
+GEOCODER_FIXTURE_FILE = env('GEOCODER_FIXTURE_FILE', None)
+YANDEX_GEOCODER_URL = env('YANDEX_GEOCODER_URL', 'https://geocode-maps.yandex.ru/1.x')
+GEOCODER_WORKERS = env.int('GEOCODER_WORKERS', 8)
+GEOCODER_BATCH_TIMEOUT = env.float('GEOCODER_BATCH_TIMEOUT', 10)
+GEOCODER_CONNECT_TIMEOUT = env.float('GEOCODER_CONNECT_TIMEOUT', 3.05)
+GEOCODER_READ_TIMEOUT = env.float('GEOCODER_READ_TIMEOUT', 5)
+GEOCODER_RETRIES = env.int('GEOCODER_RETRIES', 2)
+GEOCODER_RETRY_BACKOFF = env.float('GEOCODER_RETRY_BACKOFF', 0.5)
+GEOCODER_BREAKER_THRESHOLD = env.int('GEOCODER_BREAKER_THRESHOLD', 5)
+GEOCODER_BREAKER_WINDOW = env.int('GEOCODER_BREAKER_WINDOW', 60)
+GEOCODER_BREAKER_COOLDOWN = env.int('GEOCODER_BREAKER_COOLDOWN', 30)
+GEOCODER_NOT_FOUND_RETRY_DELAY = env.int('GEOCODER_NOT_FOUND_RETRY_DELAY', 60 * 60)
+GEOCODER_NOT_FOUND_MAX_RETRY_DELAY = env.int('GEOCODER_NOT_FOUND_MAX_RETRY_DELAY', 30 * 24 * 60 * 60)
+GEOCODER_DISTANCE_METHOD = env('GEOCODER_DISTANCE_METHOD', 'geodesic')
+GEOCODER_LRU_SIZE = env.int('GEOCODER_LRU_SIZE', 10000)
+GEOCODER_CACHE_MIN_TTL = env.int('GEOCODER_CACHE_MIN_TTL', 60)
+GEOCODER_CACHE_MAX_TTL = env.int('GEOCODER_CACHE_MAX_TTL', 24 * 60 * 60)
+
+MANAGER_ORDERS_PAGE_SIZE = env.int('MANAGER_ORDERS_PAGE_SIZE', 50)
+MANAGER_CANDIDATES_LIMIT = env.int('MANAGER_CANDIDATES_LIMIT', 5)
+MANAGER_CANDIDATES_RADIUS = env.float('MANAGER_CANDIDATES_RADIUS', None)
+ORDERS_CHANGES_POLL_INTERVAL = env.float('ORDERS_CHANGES_POLL_INTERVAL', 1)
+ORDERS_CHANGES_OVERLAP = env.float('ORDERS_CHANGES_OVERLAP', 5)
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', 24 * 60 * 60)
+ORDERS_BATCH_MAX_SIZE = env.int('ORDERS_BATCH_MAX_SIZE', 500)
+ADMIN_EXACT_COUNT_LIMIT = env.int('ADMIN_EXACT_COUNT_LIMIT', 10000)
+
+METRICS_DIR = env('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'star_burger_metrics'))
+METRICS_FLUSH_INTERVAL = env.float('METRICS_FLUSH_INTERVAL', 5)
+METRICS_TOKEN = env('METRICS_TOKEN', None)
+GEOCODER_METRICS_HOOK = env('GEOCODER_METRICS_HOOK', 'star_burger.metrics.record_geocoder_request')
 
 INSTALLED_APPS = [
     'foodcartapp.apps.FoodcartappConfig',
@@ -30,9 +63,11 @@ INSTALLED_APPS = [
     'rest_framework',
     'debug_toolbar',
     'geocoder',
+    'analytics',
 ]
 
 MIDDLEWARE = [
+    'star_burger.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -91,6 +126,10 @@ DATABASES = {
     )
 }
 
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -0,0 +1,71 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .metrics import MetricsRegistry, registry
+
+
+class MetricsRegistryTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.registry = MetricsRegistry(directory.name, flush_interval=60)
+
+    def test_files_of_finished_processes_are_removed(self):
+        finished = subprocess.run([sys.executable, '-c', 'import os; print(os.getpid())'], capture_output=True)
+        finished_path = os.path.join(self.registry.directory, f'{int(finished.stdout)}.json')
+        with open(finished_path, 'w') as dump_file:
+            json.dump({'counters': [['http_requests_total', [], 5]], 'histograms': []}, dump_file)
+        self.registry.inc('http_requests_total', {})
+        self.registry.flush()
+
+        counters, _ = self.registry.collect()
+        self.assertEqual(dict(counters), {('http_requests_total', ()): 1})
+        self.assertFalse(os.path.exists(finished_path))
+        self.assertTrue(os.path.exists(self.registry.path))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_forked_process_starts_empty(self):
+        self.registry.inc('http_requests_total', {'status': 'parent'})
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if not pid:
+            self.registry.inc('http_requests_total', {'status': 'child'})
+            self.registry.flush()
+            with open(self.registry.path) as dump_file:
+                os.write(write_end, dump_file.read().encode())
+            os._exit(0)
+        os.close(write_end)
+        with os.fdopen(read_end) as pipe:
+            child_dump = json.load(pipe)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(child_dump['counters'], [['http_requests_total', [['status', 'child']], 1]])
+        self.assertNotEqual(self.registry.path, os.path.join(self.registry.directory, f'{pid}.json'))
+
+
+@override_settings(METRICS_TOKEN='secret')
+class MetricsViewTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        directory_patch = mock.patch.object(registry, 'directory', directory.name)
+        directory_patch.start()
+        self.addCleanup(directory_patch.stop)
+
+    def test_requests_are_counted(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        User.objects.create_user('manager', password='password', is_staff=True)
+        self.client.login(username='manager', password='password')
+
+        response = self.client.get('/metrics')
+        self.assertIn('http_requests_total{method="GET",status="403",view="metrics"} 1', response.content.decode())
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
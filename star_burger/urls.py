@@ -20,13 +20,15 @@ from django.shortcuts import render
 from django.urls import path, include
 
 from . import settings
+from .metrics import metrics_view
 
 urlpatterns = [
                   path('admin/', admin.site.urls),
                   path('', render, kwargs={'template_name': 'index.html'}, name='start_page'),
                   path('api/', include('foodcartapp.urls')),
                   path('manager/', include('restaurateur.urls')),
-                  path('api-auth/', include('rest_framework.urls'))
+                  path('api-auth/', include('rest_framework.urls')),
+                  path('metrics', metrics_view, name='metrics'),
               ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 
 if settings.DEBUG: